@@ -1,7 +1,11 @@
 import datetime as dt
+import gzip
+import os
 import time as tm
+import typing
 
-from flask import current_app, has_app_context, abort, request, redirect, flash, jsonify, url_for
+from flask import current_app, g, has_app_context, abort, request, redirect, flash, jsonify, url_for, \
+    Response, send_file, stream_with_context
 from flask_admin import Admin, expose, AdminIndexView
 from flask_admin.contrib.sqla import ModelView as SQLAlchemyModelView
 from flask_admin.contrib.sqla.filters import EnumEqualFilter
@@ -12,13 +16,20 @@ from flask_security import current_user, login_required
 import sqlalchemy as sa
 import wtforms as wtf
 
+from answers import answer_writer
+from cache import LRUCache
+from events import quiz_events
+from media import media_store
+from rescoring import rescoring
 import model as md
 from form import CreateSectionForm, TEMPLATE_FORMS
+from updates import update_tracker
 
 
-class IndexView(AdminIndexView):
-    api_updates = {}
+content_cache = LRUCache(64)
+
 
+class IndexView(AdminIndexView):
     @expose('/')
     def index(self, page: int = 1):
         per_page = current_app.config.get('PER_PAGE', 20)
@@ -45,16 +56,24 @@ class IndexView(AdminIndexView):
         if current_user.is_anonymous:
             return abort(403)
 
-        return self.render('quiz.html', quiz=quiz)
+        return self.render('quiz.html', quiz=quiz, events=current_app.config.get('QUIZ_EVENTS', False))
 
     @expose('/refresh_all')
     def refresh_all(self):
         if current_user.has_role('admin'):
-            for ans in md.Answer.query:
-                ans.set_points()
-            md.db.session.commit()
-        
-        return redirect(request.referrer)
+            if rescoring.start(request.args.get('quiz_id', None, type=int)) is None:
+                flash(_('Rescoring is already running.'), 'warning')
+            else:
+                flash(_('Rescoring started.'), 'info')
+
+        return redirect(request.referrer or url_for('admin.index'))
+
+    @expose('/api/rescoring')
+    def rescoring_status(self):
+        if not current_user.has_role('admin'):
+            return abort(403)
+
+        return jsonify(rescoring.status())
 
     @expose('/quiz/<int:quiz_id>/static')
     def quiz_static(self, quiz_id: int):
@@ -82,13 +101,14 @@ class IndexView(AdminIndexView):
         form = TEMPLATE_FORMS.get(template, CreateSectionForm)()
 
         if isinstance(form, CreateSectionForm):
-            form.existing.choices = [(s.id, s.name) for s in current_user.sections.filter_by(container_id=None)]
+            sections = current_user.sections.order_by(md.Section.container_id, md.Section.order_number)
+            form.existing.choices = [(s.id, f'{s.container} / {s.name}' if s.container else s.name) for s in sections]
             if request.method == 'POST' and form.validate_on_submit():
                 if form.load_template.data:
                     return redirect(url_for('admin.add_section', quiz_id=quiz_id, template=form.template.data))
                 elif form.load_existing.data:
-                    section = md.Section.query.get(form.existing.data)
-                    section.container_id = quiz_id
+                    section = current_user.sections.filter_by(id=form.existing.data).first_or_404()
+                    section = section.clone(md.Quiz.query.get(quiz_id or 0), current_user)
                     md.db.session.commit()
                     return redirect(url_for('section.edit_view', id=section.id, url='/'))
             else:
@@ -102,25 +122,23 @@ class IndexView(AdminIndexView):
                 if form.submit.data:
                     quiz = md.Quiz.query.get(quiz_id or 0)
                     section = form.create(quiz)
+                    section.place()
                     md.db.session.commit()
                     return redirect(url_for('section.edit_view', id=section.id, url='/'))
 
             return self.render('editor/template.html', form=form)
 
 
-    def load_quiz_data(self, quiz, include_content: bool = True):
-        cached_content = [int(x) if x else 0 for x in request.args.get('cached_content', '0').split(',')]
-        cached_answers = [int(x) if x else 0 for x in request.args.get('cached_answers', '0').split(',')]
-
-        self.api_updates[(current_user.id, quiz.id)] = dt.datetime.utcnow()
-        resp = quiz.data(current_user, cached_content=cached_content,
-                         cached_answers=cached_answers, include_content=include_content)
+    def load_quiz_data(self, quiz, since: int = None):
+        update_tracker.store.set(current_user.id, quiz.id, dt.datetime.utcnow())
+        resp = quiz.data(current_user, since)
         return resp
 
 
     @expose('/api/quiz/<int:quiz_id>/', methods=['GET', 'POST'])
     def quiz_data(self, quiz_id: int):
         force = request.args.get('force', False)
+        since = request.args.get('since', None, type=int)
 
         quiz = md.Quiz.query.get(quiz_id)
         if quiz is None:
@@ -129,12 +147,129 @@ class IndexView(AdminIndexView):
         if current_user.is_anonymous:
             return abort(403)
 
-        if force or self.api_updates.get((current_user.id, quiz_id), dt.datetime(1970, 1, 1)) < quiz.last_updated:
-            resp = self.load_quiz_data(quiz)
-            return jsonify(resp)
+        etag = quiz.etag(current_user)
+        if not force and etag in request.if_none_match:
+            return self.not_modified(etag)
+
+        if force or request.if_none_match \
+                or (update_tracker.store.get(current_user.id, quiz_id) or dt.datetime(1970, 1, 1)) < quiz.last_updated:
+            resp = self.load_quiz_data(quiz, None if force else since)
+            return self.conditional(jsonify(resp), etag)
 
         return jsonify(None)
 
+    @expose('/api/quiz/<int:quiz_id>/events')
+    def quiz_events(self, quiz_id: int):
+        """Streams the updates of a quiz as Server-Sent Events.
+
+        Each open stream holds a worker thread until `EVENTS_TIMEOUT`, so it is only enabled with the `QUIZ_EVENTS`
+        setting, for deployments with asynchronous workers (e.g. gevent). Clients poll otherwise.
+        """
+        if not current_app.config.get('QUIZ_EVENTS', False):
+            return abort(404)
+
+        quiz = md.Quiz.query.get(quiz_id)
+        if quiz is None:
+            return abort(404)
+
+        if current_user.is_anonymous:
+            return abort(403)
+
+        timeout = current_app.config.get('EVENTS_TIMEOUT', 300)
+        keep_alive = current_app.config.get('EVENTS_KEEP_ALIVE', 15)
+        version = quiz.last_updated
+        md.db.session.remove()
+
+        def stream():
+            last_version = version
+            started = tm.monotonic()
+            yield 'retry: 2000\n\n'
+            with quiz_events.watch(quiz_id):
+                while tm.monotonic() - started < timeout:
+                    new_version = quiz_events.wait(
+                        quiz_id, last_version, min(keep_alive, timeout - (tm.monotonic() - started)))
+                    if new_version != last_version:
+                        last_version = new_version
+                        yield f'event: update\ndata: {new_version.isoformat() if new_version else ""}\n\n'
+                    else:
+                        yield ': keep-alive\n\n'
+
+        return Response(
+            stream_with_context(stream()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @expose('/api/content/<string:content_hash>')
+    def content(self, content_hash: str):
+        if current_user.is_anonymous:
+            return abort(403)
+
+        if content_hash in request.if_none_match:
+            return self.immutable(Response(status=304), content_hash)
+
+        column = None
+        for (question_id, question_hash, answer_hash, open_, section_closed, section_user_id) in md.db.session.query(
+                    md.Question.id, md.Question.content_hash, md.Question.answer_content_hash,
+                    md.Question.open, md.Section.closed, md.Section.user_id)\
+                .join(md.Section, md.Question.container_id == md.Section.id)\
+                .filter(sa.or_(md.Question.content_hash == content_hash,
+                               md.Question.answer_content_hash == content_hash)):
+            is_host = section_user_id == current_user.id or current_user.has_role('admin')
+            if question_hash == content_hash and (open_ or is_host):
+                column = md.Question.content
+            elif answer_hash == content_hash and (section_closed or is_host):
+                column = md.Question.answer_content
+            else:
+                continue
+
+            break
+        else:
+            return abort(404)
+
+        gzip_accepted = 'gzip' in request.accept_encodings
+        data = content_cache.get((content_hash, gzip_accepted))
+        if data is None:
+            data = md.db.session.query(column).filter(md.Question.id == question_id).scalar().encode()
+            if gzip_accepted:
+                data = gzip.compress(data)
+            if len(data) <= current_app.config.get('CONTENT_CACHE_ITEM_SIZE', 1024 * 1024):
+                content_cache.set((content_hash, gzip_accepted), data)
+
+        response = Response(data, mimetype='text/html')
+        if gzip_accepted:
+            response.content_encoding = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return self.immutable(response, content_hash)
+
+    @staticmethod
+    def immutable(response: Response, etag: str) -> Response:
+        """Allows clients to cache a response of a content addressed resource forever."""
+        response.set_etag(etag)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.max_age = 365 * 24 * 60 * 60
+        response.cache_control.immutable = True
+        return response
+
+    @expose('/media/<string:file_name>')
+    def media(self, file_name: str):
+        if current_user.is_anonymous:
+            return abort(403)
+
+        path = media_store.path(file_name)
+        if path is None or not os.path.isfile(path):
+            return abort(404)
+
+        response = self.immutable(send_file(os.path.abspath(path), add_etags=False), file_name.split('.')[0])
+        return response.make_conditional(request, accept_ranges=True, complete_length=os.path.getsize(path))
+
+    @expose('/api/update_store')
+    def update_store(self):
+        if not current_user.has_role('admin'):
+            return abort(403)
+
+        return jsonify(update_tracker.store.stats())
+
     @expose('/api/quiz/<int:quiz_id>/join', methods=['GET', 'POST'])
     def join(self, quiz_id: int):
         password = request.json.get('password', None) if request.json else request.values.get('password', None)
@@ -159,11 +294,11 @@ class IndexView(AdminIndexView):
         if current_user.is_anonymous:
             return abort(403)
 
-        if current_user in question.likes:
-            question.likes.remove(current_user)
-        else:
-            question.likes.append(current_user)
+        (liked, likes) = question.toggle_like(current_user)
         md.db.session.commit()
+        if self.compact():
+            return jsonify({'id': question.id, 'liked': liked, 'likes': likes})
+
         return jsonify(question.as_dict(current_user))
 
     @expose('/api/sections/<int:section_id>/open', methods=['POST'])
@@ -179,6 +314,7 @@ class IndexView(AdminIndexView):
         section.open = not section.open
         section.container.last_updated = dt.datetime.utcnow()
         md.db.session.commit()
+        quiz_events.publish(section.container_id, section.container.last_updated)
         return jsonify(None)
 
     @expose('/api/sections/<int:section_id>/close', methods=['POST'])
@@ -196,11 +332,55 @@ class IndexView(AdminIndexView):
             for question in section.questions:
                 question.open = False
                 question.closed = True
-        section.calculate_points()
+
+            # Answers are scored when submitted
+            if section.rescoring_needed():
+                section.calculate_points()
+            else:
+                section.update_scores()
         section.container.last_updated = dt.datetime.utcnow()
         md.db.session.commit()
+        quiz_events.publish(section.container_id, section.container.last_updated)
         return jsonify(None)
 
+    @expose('/api/quiz/<int:quiz_id>/order', methods=['POST'])
+    def order_sections(self, quiz_id: int):
+        quiz: md.Quiz = md.Quiz.query.get(quiz_id)
+        if quiz is None:
+            return abort(404)
+
+        if not (current_user.is_authenticated
+                and (current_user in quiz.hosts or current_user.has_role('admin'))):
+            return abort(403)
+
+        return self.reorder(md.Section, quiz, quiz)
+
+    @expose('/api/sections/<int:section_id>/order', methods=['POST'])
+    def order_questions(self, section_id: int):
+        section: md.Section = md.Section.query.get(section_id)
+        if section is None:
+            return abort(404)
+
+        if not (current_user.is_authenticated
+                and (current_user.id == section.user_id or current_user.has_role('admin'))):
+            return abort(403)
+
+        return self.reorder(md.Question, section, section.container)
+
+    @staticmethod
+    def reorder(model_class, container, quiz: md.Quiz) -> Response:
+        """Applies the order of ids posted as `order` to the items of the container."""
+        ids = request.json.get('order', None) if request.json else request.values.getlist('order')
+        try:
+            moved = model_class.reorder(container, [int(item_id) for item_id in ids or ()])
+        except (TypeError, ValueError):
+            return abort(400)
+
+        md.db.session.commit()
+        if moved and quiz is not None:
+            quiz_events.publish(quiz.id, quiz.last_updated)
+        return jsonify({'moved': moved})
+
     @expose('/api/questions/<int:question_id>/open', methods=['POST'])
     def open_question(self, question_id: int):
         question: md.Question = md.Question.query.get(question_id)
@@ -214,6 +394,7 @@ class IndexView(AdminIndexView):
         question.open = not question.open
         question.container.container.last_updated = dt.datetime.utcnow()
         md.db.session.commit()
+        quiz_events.publish(question.container.container_id, question.container.container.last_updated)
         return jsonify(None)
 
     @expose('/api/questions/<int:question_id>/close', methods=['POST'])
@@ -229,6 +410,7 @@ class IndexView(AdminIndexView):
         question.closed = not question.closed
         question.container.container.last_updated = dt.datetime.utcnow()
         md.db.session.commit()
+        quiz_events.publish(question.container.container_id, question.container.container.last_updated)
         return jsonify(None)
 
     @expose('/api/questions/<int:question_id>/answer', methods=['POST'])
@@ -242,20 +424,82 @@ class IndexView(AdminIndexView):
 
         value = request.json.get('value', None) if request.json else request.values.get('value', None)
 
-        if value and question.allowed(current_user):
-            number_of_answers = md.db.session.query(sa.func.sum(md.Answer.id))\
-                .filter(md.Answer.user_id == current_user.id)\
-                .filter(md.Answer.question == question)\
-                .first()[0]
-            if (number_of_answers or 0) < question.max_answers:
-                md.db.session.add(md.Answer(
-                    value=value,
-                    user_id=current_user.id,
-                    question_id=question.id))
-                md.db.session.commit()
+        ids = [None]
+        if value and not question.closed:
+            # Rules of the question are checked when storing, also for concurrent submissions
+            try:
+                ids = answer_writer.submit([(current_user.id, question.id, value)])
+            except TimeoutError:
+                return abort(503)
+
+        if self.compact():
+            return jsonify({
+                'id': question.id,
+                'accepted': [answer_id for answer_id in ids if answer_id is not None],
+                'answers': [value for (value,) in md.db.session.query(md.Answer.value)
+                            .filter(md.Answer.question_id == question.id)
+                            .filter(md.Answer.user_id == current_user.id)
+                            .order_by(md.Answer.id)]
+            })
 
         return jsonify(question.as_dict(current_user))
 
+    @expose('/api/sections/<int:section_id>/answers', methods=['POST'])
+    def set_answers(self, section_id: int):
+        """Replaces the answers of the user to questions of a section in a single transaction.
+
+        Expects a JSON object with `answers`, mapping question ids to a value or a list of values. The answers of
+        the user to the listed questions are deleted, then the values are stored as new answers, enforcing
+        the rules of the questions. Closed questions are left unchanged.
+        """
+        section: md.Section = md.Section.query.get(section_id)
+        if section is None:
+            return abort(404)
+
+        if current_user.is_anonymous:
+            return abort(403)
+
+        answers = request.json.get('answers', None) if request.json else None
+        if not isinstance(answers, dict):
+            return abort(400)
+
+        closed = dict(md.db.session.query(md.Question.id, md.Question.closed)
+                      .filter(md.Question.container_id == section.id))
+        values = {}
+        for (question_id, question_values) in answers.items():
+            if isinstance(question_values, str) or question_values is None:
+                question_values = [question_values]
+            try:
+                question_id = int(question_id)
+            except ValueError:
+                return abort(400)
+            if question_id not in closed or not isinstance(question_values, list)\
+                    or not all(value is None or isinstance(value, str) for value in question_values):
+                return abort(400)
+            values[question_id] = [value for value in question_values if value]
+
+        question_ids = [question_id for question_id in values if not closed[question_id]]
+        submissions = [(current_user.id, question_id, value)
+                       for question_id in question_ids for value in values[question_id]]
+        try:
+            ids = answer_writer.submit(submissions, clear=(current_user.id, question_ids))
+        except TimeoutError:
+            return abort(503)
+
+        accepted = {question_id: [] for question_id in values}
+        for ((_, question_id, _), answer_id) in zip(submissions, ids):
+            if answer_id is not None:
+                accepted[question_id].append(answer_id)
+
+        stored = {question_id: [] for question_id in values}
+        for (question_id, value) in md.db.session.query(md.Answer.question_id, md.Answer.value)\
+                .filter(md.Answer.question_id.in_(list(values)))\
+                .filter(md.Answer.user_id == current_user.id)\
+                .order_by(md.Answer.id):
+            stored[question_id].append(value)
+
+        return jsonify({'accepted': accepted, 'answers': stored})
+
     @expose('/api/questions/<int:question_id>/clear', methods=['POST'])
     def clear_answers(self, question_id: int):
         question: md.Question = md.Question.query.get(question_id)
@@ -265,11 +509,14 @@ class IndexView(AdminIndexView):
         if current_user.is_anonymous:
             return abort(403)
 
+        removed = 0
         if question.allowed(current_user):
-            for answer in question.answers.filter_by(user_id=current_user.id):
-                md.db.session.delete(answer)
-
+            removed = md.Answer.clear(current_user.id, [question.id])
             md.db.session.commit()
+
+        if self.compact():
+            return jsonify({'id': question.id, 'removed': removed})
+
         return jsonify(None)
 
     @expose('/api/questions/<int:question_id>', methods=['GET'])
@@ -281,7 +528,31 @@ class IndexView(AdminIndexView):
         if current_user.is_anonymous:
             return abort(403)
 
-        return jsonify(question.as_dict(current_user))
+        etag = question.etag(current_user)
+        if etag in request.if_none_match:
+            return self.not_modified(etag)
+
+        return self.conditional(jsonify(question.as_dict(current_user)), etag)
+
+    @staticmethod
+    def compact() -> bool:
+        """Returns whether the client asked for a compact acknowledgement instead of the data of the question."""
+        if request.json and 'compact' in request.json:
+            return bool(request.json['compact'])
+        return request.values.get('compact', 0, type=int) == 1
+
+    @staticmethod
+    def conditional(response: Response, etag: str) -> Response:
+        """Adds validator to a response, so that clients revalidate it before every use."""
+        response.set_etag(etag)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    @classmethod
+    def not_modified(cls, etag: str) -> Response:
+        return cls.conditional(Response(status=304), etag)
 
 
 admin = Admin(
@@ -313,6 +584,30 @@ def add_view(name=None, category=None, model_class=None):
     return wrap
 
 
+def touch_quiz(quiz: md.Quiz):
+    """Marks quiz as updated, so that players receive the changes made in the editor."""
+    if quiz is not None:
+        quiz.last_updated = dt.datetime.utcnow()
+
+
+def preload_positions(model_class, container_ids: typing.Iterable[int]):
+    """Computes the positions of the items of the containers with a single query for the current request.
+
+    :param model_class: Ordered model class.
+    :param container_ids: IDs of the containers of the listed items.
+    """
+    positions = g.setdefault('positions', {})
+    for (item_id, position) in model_class.positions(container_ids).items():
+        positions[(model_class, item_id)] = position
+
+
+def position_of(item) -> int:
+    """Returns the position of the item, preloaded by `preload_positions` if possible."""
+    positions = g.get('positions', {})
+    key = (type(item), item.id)
+    return positions[key] if key in positions else item.position
+
+
 def query_filter(model_class, label: str = None, flt=None):
     if label is None:
         label = _l(model_class.__name__)
@@ -407,6 +702,44 @@ class ModelView(SQLAlchemyModelView):
         return _l('There are no items in the table.')
 
 
+class OrderedModelView(ModelView):
+    """Model view of sections or questions, showing and editing the position of the items as order number."""
+    column_formatters = {
+        'order_number': lambda view, context, model, name: position_of(model)
+    }
+
+    def get_list(self, *args, **kwargs):
+        (count, data) = super().get_list(*args, **kwargs)
+        if isinstance(data, list):
+            preload_positions(self.model, {item.container_id for item in data})
+        return count, data
+
+    def on_form_prefill(self, form, id):
+        form.order_number.data = self.get_one(id).position
+
+    def list_form(self, obj=None):
+        form = super().list_form(obj)
+        if obj is not None and 'order_number' in form:
+            form.order_number.data = position_of(obj)
+        return form
+
+
+class QuestionItemView(ModelView):
+    """Model view of values or answers, showing the position of their questions as question number."""
+    column_formatters = {
+        'question.order_number': lambda view, context, model, name: position_of(model.question)
+    }
+
+    def get_list(self, *args, **kwargs):
+        (count, data) = super().get_list(*args, **kwargs)
+        if isinstance(data, list) and data:
+            container_ids = md.db.session.query(md.Question.container_id)\
+                .filter(md.Question.id.in_({item.question_id for item in data}))\
+                .distinct()
+            preload_positions(md.Question, [container_id for (container_id,) in container_ids])
+        return count, data
+
+
 @add_view(_l('Quizzes'), _l('Editor'), md.Quiz)
 class QuizView(ModelView):
     columns = {
@@ -450,6 +783,24 @@ class QuizView(ModelView):
     def delete_view(self):
         return self.check_access() or super().delete_view()
 
+    @expose('/clone/', methods=('POST',))
+    def clone(self):
+        quiz = md.Quiz.query.get(request.values.get('id', 0))
+        if quiz is None:
+            return abort(404)
+
+        err = self.check_access()
+        if err:
+            return err
+
+        copy = quiz.clone(_('%(name)s (copy)', name=quiz.name))
+        if current_user not in copy.hosts:
+            copy.hosts.append(current_user)
+        md.db.session.commit()
+
+        url = request.values.get('url', url_for('quiz.index_view'))
+        return redirect(url_for('quiz.edit_view', id=copy.id, url=url))
+
     def on_model_change(self, form, model, is_created):
         if is_created and current_user not in model.hosts:
             model.hosts.append(current_user)
@@ -457,7 +808,7 @@ class QuizView(ModelView):
 
 
 @add_view(_l('Sections'), _l('Editor'), md.Section)
-class SectionView(ModelView):
+class SectionView(OrderedModelView):
     columns = {
         'user': _l('User'),
         'container': _l('Quiz'),
@@ -493,23 +844,44 @@ class SectionView(ModelView):
     def delete_view(self):
         return self.check_access() or super().delete_view()
 
+    @expose('/clone/', methods=('POST',))
+    def clone(self):
+        section = md.Section.query.get(request.values.get('id', 0))
+        if section is None:
+            return abort(404)
+
+        err = self.check_access()
+        if err:
+            return err
+
+        # Access to the quiz given in the arguments is checked
+        quiz = md.Quiz.query.get(request.args.get('quiz_id', section.container_id or 0))
+        copy = section.clone(quiz, current_user)
+        md.db.session.commit()
+
+        return redirect(url_for('section.edit_view', id=copy.id, url=request.values.get('url', request.referrer)))
+
     def create_form(self, obj=None):
         form = super().create_form(obj)
         container_id = request.args.get('quiz_id', None)
-        if container_id:
-            form.order_number.data = md.Section.get_next_order_number(md.Quiz.query.get(container_id))
+        if container_id and form.order_number.data is None:
+            form.order_number.data = md.Section.next_position(md.Quiz.query.get(container_id))
         return form
 
     def on_model_change(self, form, model, is_created):
         container_id = request.args.get('quiz_id', None)
         if container_id:
             model.container_id = container_id
-        if is_created and model.order_number is None:
-            model.set_order()
+        model.place()
         if model.user is None:
             model.user = current_user
+        md.db.session.flush()
+        touch_quiz(model.container)
         md.db.session.commit()
 
+    def on_model_delete(self, model):
+        touch_quiz(model.container)
+
     def get_query(self):
         query = md.db.session.query(md.Section)\
             .order_by(md.Section.container_id, md.Section.order_number)
@@ -530,7 +902,7 @@ class SectionView(ModelView):
 
 
 @add_view(_l('Questions'), _l('Editor'), md.Question)
-class QuestionView(ModelView):
+class QuestionView(OrderedModelView):
     columns = {
         'container': _l('Section'),
         'order_number': _l('Order Number'),
@@ -607,28 +979,63 @@ class QuestionView(ModelView):
             return err
 
         question.duplicate()
+        touch_quiz(question.container.container)
         md.db.session.commit()
 
         return redirect(url)
 
+    @expose('/answers/', methods=('GET', 'POST'))
+    def answers(self):
+        question = md.Question.query.get(request.args.get('id', 0))
+        if question is None:
+            return abort(404)
+
+        err = self.check_access()
+        if err:
+            return err
+
+        if request.method == 'POST':
+            try:
+                points = float(request.form.get('points', ''))
+            except ValueError:
+                flash(_('Invalid points.'), 'error')
+            else:
+                count = question.override_points(request.form.get('text', ''), points,
+                                                 add_value=bool(request.form.get('add_value')))
+                md.db.session.commit()
+                flash(_('Points of %(count)s answers set.', count=count), 'success')
+
+            return redirect(request.url)
+
+        return self.render('editor/answers.html', question=question, clusters=question.answer_clusters(),
+                           return_url=request.args.get('url', url_for('section.edit_view', id=question.container_id)))
+
     def create_form(self, obj=None):
         form = super().create_form(obj)
         container_id = request.args.get('section_id', None)
-        if container_id:
-            form.order_number.data = md.Question.get_next_order_number(md.Section.query.get(container_id))
+        if container_id and form.order_number.data is None:
+            form.order_number.data = md.Question.next_position(md.Section.query.get(container_id))
         return form
 
     def on_model_change(self, form, model, is_created):
         container_id = request.args.get('section_id', None)
         if container_id:
             model.container_id = container_id
-        if is_created and model.order_number is None:
-            model.set_order()
+        model.content = media_store.extract(model.content)
+        model.answer_content = media_store.extract(model.answer_content)
+        model.place()
+        md.db.session.flush()
+        if model.container is not None:
+            touch_quiz(model.container.container)
         md.db.session.commit()
 
+    def on_model_delete(self, model):
+        if model.container is not None:
+            touch_quiz(model.container.container)
+
 
 @add_view(_l('Values'), _l('Editor'), md.Value)
-class ValueView(ModelView):
+class ValueView(QuestionItemView):
     columns = {
         'question.container.container': _l('Quiz'),
         'question.container': _l('Section'),
@@ -636,7 +1043,8 @@ class ValueView(ModelView):
         'order_number': _l('Order Number'),
         'text': _l('Text'),
         'allowed_misses': _l('Allowed Misses'),
-        'points': _l('Points')
+        'points': _l('Points'),
+        'override': _l('Override')
     }
     form_excluded_columns = ['question']
 
@@ -689,11 +1097,16 @@ class ValueView(ModelView):
         question_id = request.args.get('question_id', None)
         if question_id:
             model.question_id = question_id
+        md.db.session.flush()
+        touch_quiz(model.question.container.container)
         md.db.session.commit()
 
+    def on_model_delete(self, model):
+        touch_quiz(model.question.container.container)
+
 
 @add_view(_l('Answers'), _l('Editor'), md.Answer)
-class AnswerView(ModelView):
+class AnswerView(QuestionItemView):
     columns = {
         'question.container.container': _l('Quiz'),
         'question.container': _l('Section'),
@@ -733,6 +1146,16 @@ class AnswerView(ModelView):
 
         return query
 
+    def on_model_change(self, form, model, is_created):
+        md.db.session.flush()
+        model.question.container.update_scores()
+        md.db.session.commit()
+
+    def after_model_delete(self, model):
+        section = md.Section.query.join(md.Question).filter(md.Question.id == model.question_id).one()
+        section.update_scores()
+        md.db.session.commit()
+
 
 @add_view(_l('Users'), _l('Admin'), md.User)
 class UserView(ModelView):
@@ -0,0 +1,119 @@
+import queue
+import threading
+import time as tm
+import typing
+
+from flask import current_app
+
+from cache import ProcessThread
+import model as md
+
+
+class PendingAnswers:
+    """Answers waiting to be stored by the writer thread."""
+    def __init__(self, submissions: typing.List[typing.Tuple[int, int, str]],
+                 clear: typing.Tuple[int, typing.List[int]] = None):
+        self.submissions = submissions
+        self.clear = clear
+        self.ids = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class AnswerWriter:
+    """Flask extension storing answers submitted in bursts with group commits.
+
+    If the `ANSWER_WRITE_BEHIND` setting is enabled, submissions are queued in memory and stored by a writer
+    thread: after the first submission arrives it waits `ANSWER_FLUSH_INTERVAL` seconds, then stores every queued
+    submission with `Answer.store` and a single commit. Callers wait for the commit, at most `ANSWER_WRITE_TIMEOUT`
+    seconds. As the writer checks the rules of the questions, concurrent submissions of a user count for each
+    other. Otherwise answers are stored and committed in the request.
+    """
+    def __init__(self, app=None):
+        self._queue = queue.Queue()
+        self._writer = ProcessThread('answer-writer', self._run, reset=self._reset)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['answer_writer'] = self
+
+    def submit(
+            self,
+            submissions: typing.List[typing.Tuple[int, int, str]],
+            clear: typing.Tuple[int, typing.List[int]] = None) -> typing.List[typing.Optional[int]]:
+        """Stores answers, see `Answer.store`.
+
+        :param submissions: User id, question id and value of the answers.
+        :param clear: User id and question ids of answers deleted in the same transaction before storing the
+            answers, see `Answer.clear`.
+        :return: Ids of the stored answers, `None` for rejected ones.
+
+        :raise TimeoutError: If the answers were not stored in time.
+        """
+        if not current_app.config.get('ANSWER_WRITE_BEHIND', False):
+            if clear is not None:
+                md.Answer.clear(*clear)
+            ids = md.Answer.store(submissions)
+            md.db.session.commit()
+            return ids
+
+        pending = PendingAnswers(submissions, clear)
+        self._writer.start(current_app._get_current_object())
+        self._queue.put(pending)
+        if not pending.done.wait(current_app.config.get('ANSWER_WRITE_TIMEOUT', 10)):
+            raise TimeoutError('Answers were not stored in time.')
+        if pending.error is not None:
+            raise pending.error
+
+        return pending.ids
+
+    def _reset(self):
+        # Queued answers belong to the parent process
+        self._queue = queue.Queue()
+
+    def _run(self, app):
+        interval = app.config.get('ANSWER_FLUSH_INTERVAL', 0.005)
+        while True:
+            batch = [self._queue.get()]
+            tm.sleep(interval)
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            with app.app_context():
+                self._flush(batch)
+
+    @staticmethod
+    def _flush(batch: typing.List[PendingAnswers]):
+        try:
+            # Answers are cleared in order, so consecutive submissions without clearing are stored together
+            ids = []
+            submissions = []
+            for pending in batch:
+                if pending.clear is not None:
+                    ids += md.Answer.store(submissions)
+                    submissions = []
+                    md.Answer.clear(*pending.clear)
+                submissions += pending.submissions
+            ids += md.Answer.store(submissions)
+            md.db.session.commit()
+        except Exception as e:
+            md.db.session.rollback()
+            current_app.logger.exception('Storing answers failed')
+            for pending in batch:
+                pending.error = e
+        else:
+            start = 0
+            for pending in batch:
+                pending.ids = ids[start:start+len(pending.submissions)]
+                start += len(pending.submissions)
+        finally:
+            md.db.session.remove()
+            for pending in batch:
+                pending.done.set()
+
+
+answer_writer = AnswerWriter()
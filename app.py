@@ -5,9 +5,12 @@ from flask_migrate import Migrate
 from flask_security import current_user
 
 import admin
+from answers import answer_writer
 from config import Config
+from media import media_store
 from model import db
 from security import security, data_store, LoginUserForm, RegisterUserForm
+from updates import update_tracker
 
 
 app = Flask(__name__)
@@ -18,6 +21,9 @@ Bootstrap(app)
 
 security.init_app(app, data_store, login_form=LoginUserForm, register_form=RegisterUserForm)
 admin.admin.init_app(app)
+update_tracker.init_app(app)
+media_store.init_app(app)
+answer_writer.init_app(app)
 
 domain = Domain(app.config.get("BABEL_TRANSLATIONS")[0], "messages")
 babel = Babel(app, default_domain=domain)
@@ -0,0 +1,88 @@
+"""Compares scoring answers with `AnswerMatcher` to the per-value loop it replaced.
+
+Questions with many approximate values, like connection and who-am-I questions, are scored against 3000 answers:
+mostly misspelled values, and some unrelated text.
+
+Usage: python benchmarks/fuzzy_matching.py
+"""
+import os
+import random
+import string
+import sys
+import time as tm
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Levenshtein import distance as str_distance
+
+import model as md
+
+
+def loop_points(values: list, base_points: float, answer: str) -> float:
+    """Scores an answer like `Answer._calculate_points` did, without the queries of the values."""
+    for (text, misses, points) in values:
+        if points is None or points > 0:
+            continue
+        if misses:
+            if str_distance(text, answer) < misses:
+                return points or 0
+        elif text == answer:
+            return points
+
+    for (text, misses, points) in values:
+        if points is None or points <= 0:
+            continue
+        value, normalized = md.normalize_answer(text), md.normalize_answer(answer)
+        if misses:
+            if str_distance(value, normalized) < misses:
+                return points or 0
+        elif value == normalized:
+            return points
+
+    return base_points
+
+
+def main(value_counts=(5, 20, 100, 400), answer_count: int = 3000, seed: int = 1):
+    rnd = random.Random(seed)
+
+    def word() -> str:
+        return ''.join(rnd.choice(string.ascii_lowercase + '  -') for _ in range(rnd.randint(3, 24)))
+
+    def misspell(text: str) -> str:
+        chars = list(text)
+        for _ in range(rnd.randint(0, 4)):
+            operation, position = rnd.randint(0, 2), rnd.randint(0, max(len(chars) - 1, 0))
+            if operation == 0 and chars:
+                del chars[position]
+            elif operation == 1:
+                chars.insert(position, rnd.choice(string.ascii_lowercase))
+            elif chars:
+                chars[position] = rnd.choice(string.ascii_lowercase)
+        return ''.join(chars)
+
+    for value_count in value_counts:
+        values = []
+        for _ in range(value_count):
+            text = word().strip() or 'x'
+            values.append((text, rnd.choice([0, len(text) // 4 + 1, len(text) // 4 + 1]),
+                           rnd.choice([1, 2, 3, 0, -1, None])))
+        answers = [misspell(rnd.choice(values)[0]) if rnd.random() < 0.7 else word() for _ in range(answer_count)]
+        matcher = md.AnswerMatcher(0, values)
+        assert all(loop_points(values, 0, answer) == matcher.points(answer) for answer in answers)
+
+        started = tm.perf_counter()
+        for answer in answers:
+            loop_points(values, 0, answer)
+        looped = tm.perf_counter() - started
+
+        started = tm.perf_counter()
+        for answer in answers:
+            matcher.points(answer)
+        indexed = tm.perf_counter() - started
+
+        print(f'{value_count:4d} values: loop {looped / answer_count * 1e6:8.1f} us/answer, '
+              f'index {indexed / answer_count * 1e6:7.1f} us/answer, {looped / indexed:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""Compares concurrent answering and polling with the default SQLite engine and the engine profile.
+
+Worker processes run threads like the app server: writers post answers in a loop and readers poll the quiz with
+`If-None-Match`. A probe thread per worker reads with `busy_timeout=0` and counts the reads that would have waited on
+a lock. The default engine is the one without `SQLITE_PRAGMAS` and pooling (rollback journal, a connection per
+request); the profile is the configuration of `config.Config`.
+
+Usage: python benchmarks/sqlite_concurrency.py
+"""
+import collections
+import datetime as dt
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time as tm
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+import model as md
+
+
+def percentile(durations: list, fraction: float) -> float:
+    """Returns the percentile of the durations in milliseconds."""
+    durations = sorted(durations)
+    return durations[min(len(durations) - 1, int(len(durations) * fraction))] * 1000
+
+
+def build(players: int) -> tuple:
+    """Creates a quiz with a few open questions and the players answering them.
+
+    :return: ID of quiz, IDs of questions and IDs of players.
+    """
+    md.db.create_all()
+    host = md.User(username='host', email='host@example.com', password='x', active=True)
+    quiz = md.Quiz(name='Quiz', start_time=dt.datetime(2020, 1, 1), last_updated=dt.datetime(2020, 1, 1))
+    quiz.hosts.append(host)
+    md.db.session.add(quiz)
+    md.db.session.flush()
+    section = md.Section(name='Section', order_number=1, container=quiz, user_id=host.id)
+    questions = [md.Question(text=f'Question {i}', order_number=i + 1, container=section, open=True,
+                             max_answers=100000)
+                 for i in range(5)]
+    users = [md.User(username=f'player{i}', email=f'player{i}@example.com', password='x', active=True)
+             for i in range(players)]
+    md.db.session.add_all([section] + questions + users)
+    md.db.session.commit()
+    return quiz.id, [question.id for question in questions], [user.id for user in users]
+
+
+def client_for(user_id: int):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+
+def work(path: str, start: float, duration: float, quiz_id: int, question_ids: list, writers: list, readers: list,
+         results):
+    """Runs the writer, reader and probe threads of one worker process until the duration is over."""
+    stop = start + duration
+    reads, writes, counts = [], [], collections.Counter()
+
+    def write(user_id: int):
+        client = client_for(user_id)
+        i = 0
+        while tm.time() < stop:
+            i += 1
+            started = tm.perf_counter()
+            response = client.post(f'/api/questions/{question_ids[i % len(question_ids)]}/answer',
+                                   data={'value': f'answer {i}', 'compact': 1})
+            writes.append(tm.perf_counter() - started)
+            counts[f'write {response.status_code}'] += 1
+
+    def read(user_id: int):
+        client = client_for(user_id)
+        etag = client.get(f'/api/quiz/{quiz_id}/?force=1').headers.get('ETag')
+        while tm.time() < stop:
+            started = tm.perf_counter()
+            response = client.get(f'/api/quiz/{quiz_id}/', headers={'If-None-Match': etag})
+            reads.append(tm.perf_counter() - started)
+            counts[f'read {response.status_code}'] += 1
+
+    def probe():
+        connection = sqlite3.connect(path, timeout=0, isolation_level=None)
+        while tm.time() < stop:
+            try:
+                connection.execute('SELECT last_updated FROM quiz WHERE id = ?', (quiz_id,)).fetchall()
+                connection.execute('SELECT count(*) FROM answer WHERE user_id = ?', (writers[0],)).fetchall()
+                counts['probe ok'] += 1
+            except sqlite3.OperationalError:
+                counts['probe busy'] += 1
+            tm.sleep(0.002)
+
+    threads = [threading.Thread(target=write, args=(user_id,)) for user_id in writers] + \
+        [threading.Thread(target=read, args=(user_id,)) for user_id in readers] + \
+        [threading.Thread(target=probe)]
+    while tm.time() < start:
+        tm.sleep(0.001)
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((reads, writes, counts))
+
+
+def run(profile: bool, workers: int, writers: int, readers: int, duration: float):
+    """Runs one case in a fresh database, forking the worker processes after the database is built."""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'benchmark.db')
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + path, WTF_CSRF_ENABLED=False)
+    if not profile:
+        app.config.update(SQLITE_PRAGMAS={}, SQLITE_POOL_SIZE=0)
+
+    with app.app_context():
+        (quiz_id, question_ids, user_ids) = build(workers * (writers + readers))
+        md.db.session.remove()
+        md.db.get_engine().dispose()
+
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    start = tm.time() + 1
+    processes = []
+    for n in range(workers):
+        players = user_ids[n * (writers + readers):(n + 1) * (writers + readers)]
+        processes.append(context.Process(target=work, args=(
+            path, start, duration, quiz_id, question_ids, players[:writers], players[writers:], results)))
+    for process in processes:
+        process.start()
+
+    reads, writes, counts = [], [], collections.Counter()
+    for _ in processes:
+        (worker_reads, worker_writes, worker_counts) = results.get()
+        reads += worker_reads
+        writes += worker_writes
+        counts += worker_counts
+    for process in processes:
+        process.join()
+
+    blocked = counts['probe busy'] / max(counts['probe busy'] + counts['probe ok'], 1)
+    print(f'{"profile" if profile else "default"} {workers} x ({writers} + {readers}): '
+          f'probe reads blocked {blocked * 100:.1f}%, {dict(counts)}')
+    for (name, durations) in (('reads', reads), ('writes', writes)):
+        if durations:
+            print(f'  {name:6s} {len(durations) / duration:6.1f}/s p50 {percentile(durations, .5):6.1f}ms '
+                  f'p99 {percentile(durations, .99):7.1f}ms max {max(durations) * 1000:7.1f}ms')
+
+
+def main(cases=((4, 2, 2), (1, 8, 4)), duration: float = 10):
+    warnings.filterwarnings('ignore')
+    for (workers, writers, readers) in cases:
+        for profile in (False, True):
+            # Each run gets its own process, so that the engine is created with the configuration of the run
+            process = multiprocessing.get_context('fork').Process(
+                target=run, args=(profile, workers, writers, readers, duration))
+            process.start()
+            process.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import collections
+import os
+import threading
+import typing
+
+
+class LRUCache:
+    """Thread-safe dictionary keeping the most recently used entries.
+
+    :param size: Maximum number of entries.
+    """
+    def __init__(self, size: int = 128):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: typing.Hashable, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: typing.Hashable, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: typing.Hashable, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ProcessThread:
+    """Daemon thread run once in each process.
+
+    Threads do not survive forking into worker processes, so the thread is started again by the first `start` call
+    in every process, after `reset` drops the state inherited from the parent process.
+
+    :param name: Name of the thread.
+    :param target: Function run by the thread.
+    :param reset: Function called before the thread is started in a process.
+    """
+    def __init__(self, name: str, target: typing.Callable, reset: typing.Callable[[], None] = None):
+        self.name = name
+        self.target = target
+        self.reset = reset
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self, *args):
+        """Starts the thread with the arguments, unless it is running in this process."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                if self.reset is not None:
+                    self.reset()
+            self._thread = threading.Thread(target=self.target, args=args, name=self.name, daemon=True)
+            self._thread.start()
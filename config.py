@@ -17,3 +17,33 @@ class Config(LocalConfig):
     SECURITY_USER_IDENTITY_ATTRIBUTES = ["username", "email"]
     SECURITY_REGISTERABLE = True
     SECURITY_SEND_REGISTER_EMAIL = False
+
+    # Server-Sent Events hold a worker thread per open stream: only enable with asynchronous workers
+    QUIZ_EVENTS = False
+    EVENTS_CHECK_INTERVAL = 1
+    EVENTS_TIMEOUT = 300
+    EVENTS_KEEP_ALIVE = 15
+
+    UPDATE_STORE = "memory"
+    UPDATE_STORE_PATH = os.path.join(DIR, "data/updates.db")
+    UPDATE_STORE_TTL = 6 * 60 * 60
+
+    MEDIA_DIRECTORY = os.path.join(DIR, "data/media")
+    MEDIA_URL = "/media/"
+
+    RESCORING_CHUNK_SIZE = 1000
+    RESCORING_PROCESSES = 2
+
+    ANSWER_WRITE_BEHIND = False
+    ANSWER_FLUSH_INTERVAL = 0.005
+    ANSWER_WRITE_TIMEOUT = 10
+
+    SQLITE_PRAGMAS = {
+        "journal_mode": "wal",
+        "synchronous": "normal",
+        "busy_timeout": 5000,
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -16 * 1024,
+    }
+    SQLITE_POOL_SIZE = 10
+    SQLITE_POOL_OVERFLOW = -1
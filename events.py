@@ -0,0 +1,90 @@
+import contextlib
+import threading
+import time as tm
+import typing
+
+from flask import current_app
+
+from cache import ProcessThread
+import model as md
+
+
+class QuizEvents:
+    """Wakes up the event streams of a quiz when it is updated.
+
+    Updates made in this process are published directly. Updates made by other processes are found by a single
+    watcher thread per process, which reads the `last_updated` of every quiz with open streams in one query every
+    `EVENTS_CHECK_INTERVAL` seconds and publishes the changed ones, so the number of queries does not grow with the
+    number of streams.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._versions = {}
+        self._watched = {}
+        self._watcher = ProcessThread('quiz-events', self._run, reset=self._reset)
+
+    def publish(self, quiz_id: int, version: typing.Hashable):
+        """Stores new version of quiz and notifies the waiting streams."""
+        with self._condition:
+            self._versions[quiz_id] = version
+            self._condition.notify_all()
+
+    def wait(self, quiz_id: int, version: typing.Hashable, timeout: float) -> typing.Hashable:
+        """Waits until the quiz is published with a version other than the given one.
+
+        :param quiz_id: ID of quiz.
+        :param version: Last version known by the caller.
+        :param timeout: Maximum number of seconds to wait.
+        :return: Last published version, or `version` if nothing was published.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._versions.get(quiz_id, version) != version, timeout)
+            return self._versions.get(quiz_id, version)
+
+    @contextlib.contextmanager
+    def watch(self, quiz_id: int):
+        """Watches the quiz for updates made by other processes while the context is active."""
+        self._watcher.start(current_app._get_current_object())
+        with self._condition:
+            self._watched[quiz_id] = self._watched.get(quiz_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._watched[quiz_id] -= 1
+                if not self._watched[quiz_id]:
+                    del self._watched[quiz_id]
+
+    def _reset(self):
+        # Streams belong to the parent process
+        with self._condition:
+            self._watched = {}
+
+    def _run(self, app):
+        interval = app.config.get('EVENTS_CHECK_INTERVAL', 1)
+        while True:
+            tm.sleep(interval)
+            with self._condition:
+                quiz_ids = list(self._watched)
+            if not quiz_ids:
+                continue
+
+            with app.app_context():
+                try:
+                    versions = md.db.session.query(md.Quiz.id, md.Quiz.last_updated)\
+                        .filter(md.Quiz.id.in_(quiz_ids))\
+                        .all()
+                except Exception:
+                    app.logger.exception('Checking quiz updates failed')
+                    continue
+                finally:
+                    md.db.session.remove()
+
+            with self._condition:
+                changed = [(quiz_id, version) for (quiz_id, version) in versions
+                           if self._versions.get(quiz_id) != version]
+            for (quiz_id, version) in changed:
+                self.publish(quiz_id, version)
+
+
+quiz_events = QuizEvents()
@@ -0,0 +1,24 @@
+import sqlalchemy as sa
+
+from app import app
+from media import media_store
+import model
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        question_ids = [question_id for (question_id, ) in model.db.session.query(model.Question.id).filter(
+            sa.or_(model.Question.content.contains('data:'), model.Question.answer_content.contains('data:')))]
+
+        count = 0
+        for question_id in question_ids:
+            question = model.Question.query.get(question_id)
+            content = media_store.extract(question.content)
+            answer_content = media_store.extract(question.answer_content)
+            if content != question.content or answer_content != question.answer_content:
+                question.content = content
+                question.answer_content = answer_content
+                model.db.session.commit()
+                count += 1
+
+        print(f'Extracted media of {count} questions.')
@@ -1,5 +1,7 @@
+import datetime as dt
 import os
 from flask_migrate import init, migrate, upgrade
+import sqlalchemy as sa
 
 from app import app
 import model
@@ -28,3 +30,22 @@ if __name__ == '__main__':
             admin_user.roles.append(admin_role)
             model.db.session.add(admin_user)
             model.db.session.commit()
+
+        for question in model.Question.query.filter(sa.or_(
+                sa.and_(model.Question.content.isnot(None), model.Question.content_hash.is_(None)),
+                sa.and_(model.Question.answer_content.isnot(None), model.Question.answer_content_hash.is_(None)))):
+            question.content_hash = model.content_hash(question.content)
+            question.answer_content_hash = model.content_hash(question.answer_content)
+
+        # Answers of open sections may have been submitted before they were scored on submission
+        for question in model.Question.query\
+                .join(model.Section, model.Question.container_id == model.Section.id)\
+                .filter(model.Section.closed == False)\
+                .filter(model.Question.scoring_changed.is_(None))\
+                .filter(model.Question.answers.any()):
+            question.scoring_changed = dt.datetime.utcnow()
+
+        for section in model.Section.query.filter_by(closed=True):
+            if section.scores.first() is None:
+                section.update_scores()
+        model.db.session.commit()
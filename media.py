@@ -0,0 +1,82 @@
+import base64
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+import typing
+
+from flask import current_app
+
+
+DATA_URI = re.compile(r'(?P<attr>\b(?:src|href)\s*=\s*)(?P<quote>["\'])data:(?P<mimetype>[\w.+-]+/[\w.+-]+)'
+                      r'(?:;[\w.+-]+=[\w.+-]+)*;base64,(?P<data>[A-Za-z0-9+/=\s]+)(?P=quote)')
+MEDIA_NAME = re.compile(r'^[0-9a-f]{64}(\.\w+)?$')
+
+
+class MediaStore:
+    """Flask extension storing media embedded in question contents as content addressed files.
+
+    Files are stored in the `MEDIA_DIRECTORY` setting and referenced by URLs starting with `MEDIA_URL`.
+    """
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        directory = app.config.get('MEDIA_DIRECTORY', 'data/media')
+        os.makedirs(directory, exist_ok=True)
+        app.extensions['media_store'] = self
+
+    @property
+    def directory(self) -> str:
+        return current_app.config.get('MEDIA_DIRECTORY', 'data/media')
+
+    @property
+    def url(self) -> str:
+        return current_app.config.get('MEDIA_URL', '/media/')
+
+    def path(self, name: str) -> typing.Optional[str]:
+        """Returns path of stored file, or `None` if name is not a valid media name."""
+        if not MEDIA_NAME.match(name):
+            return None
+        return os.path.join(self.directory, name)
+
+    def save(self, data: bytes, mimetype: str) -> str:
+        """Stores file unless it exists already.
+
+        :param data: Content of file.
+        :param mimetype: MIME type of content, used to determine extension.
+        :return: Name of file.
+        """
+        name = hashlib.sha256(data).hexdigest() + (mimetypes.guess_extension(mimetype) or '')
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            temp_path = f'{path}.{os.getpid()}.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        return name
+
+    def extract(self, content: typing.Optional[str]) -> typing.Optional[str]:
+        """Moves base64 data URIs of content into files and replaces them with URLs.
+
+        :param content: HTML content.
+        :return: Content referencing media by URL.
+        """
+        if not content or 'data:' not in content:
+            return content
+
+        def replace(match) -> str:
+            try:
+                data = base64.b64decode(re.sub(r'\s', '', match.group('data')), validate=True)
+            except (binascii.Error, ValueError):
+                return match.group(0)
+
+            name = self.save(data, match.group('mimetype'))
+            return f'{match.group("attr")}{match.group("quote")}{self.url}{name}{match.group("quote")}'
+
+        return DATA_URI.sub(replace, content)
+
+
+media_store = MediaStore()
@@ -1,5 +1,12 @@
+import collections
+import csv
 import datetime as dt
+import hashlib
+import io
+import os
 import random
+import threading
+import time as tm
 import typing
 
 from flask_security import UserMixin, RoleMixin
@@ -9,16 +16,83 @@ from Levenshtein import distance as str_distance
 import sqlalchemy as sa
 from sqlalchemy.ext.declarative import declared_attr
 
+from cache import LRUCache
+
+
+class IdAllocator:
+    """Hands out random ids not used in the tables of models.
+
+    Ids are checked against the table right before the rows are inserted, with a single query for all rows of a table
+    in a flush (see `assign_ids`) or bulk insert (see `allocate_many`). Taken candidates are drawn again, at most
+    `attempts` times. Ids handed out by a process are not handed out again by it for the next `recent` ids of the
+    table, as they may not be inserted yet.
+
+    :param attempts: Number of times taken candidates are drawn again.
+    :param recent: Number of ids handed out remembered for each table.
+    :param chunk_size: Number of candidates checked by a query.
+    """
+    def __init__(self, attempts: int = 10, recent: int = 16384, chunk_size: int = 500):
+        self.attempts = attempts
+        self.recent = recent
+        self.chunk_size = chunk_size
+        self._issued = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def allocate(self, model_class) -> int:
+        return self.allocate_many(model_class, 1)[0]
+
+    def allocate_many(self, model_class, count: int) -> typing.List[int]:
+        """Returns ids for new rows of the table of the model, which are not used in the table yet.
+
+        :param model_class: Model of the rows.
+        :param count: Number of ids.
+        """
+        column = model_class.__table__.c.id
+        ids = []
+        for _ in range(self.attempts):
+            candidates = self._draw(model_class, count - len(ids))
+            taken = set()
+            for i in range(0, len(candidates), self.chunk_size):
+                chunk = candidates[i:i+self.chunk_size]
+                taken.update(row[0] for row in db.session.execute(sa.select([column]).where(column.in_(chunk))))
+            ids.extend(candidate for candidate in candidates if candidate not in taken)
+            if len(ids) == count:
+                return ids
+
+        raise RuntimeError(f'No free ids found for table {model_class.__table__.name}')
+
+    def _draw(self, model_class, count: int) -> typing.List[int]:
+        """Draws random candidates not handed out recently by this process."""
+        low, high = 10**(model_class.id_length-1), 10**model_class.id_length-1
+        with self._lock:
+            if self._pid != os.getpid():
+                self._issued.clear()
+                self._pid = os.getpid()
+
+            (order, issued) = self._issued.setdefault(model_class.__table__.name, (collections.deque(), set()))
+            candidates = []
+            while len(candidates) < count:
+                candidate = random.randint(low, high)
+                if candidate not in issued:
+                    candidates.append(candidate)
+                    order.append(candidate)
+                    issued.add(candidate)
+
+            while len(order) > self.recent:
+                issued.discard(order.popleft())
+            return candidates
+
+
+id_allocator = IdAllocator()
+
 
 class BaseModel(Model):
     id_length = 9
 
     @classmethod
     def generate_id(cls):
-        while True:
-            new_id = random.randint(10**(cls.id_length-1), 10**cls.id_length-1)
-            if cls.query.get(new_id) is None:
-                return new_id
+        return id_allocator.allocate(cls)
 
     @declared_attr
     def id(cls):
@@ -31,29 +105,33 @@ class BaseModel(Model):
             separator: str = ';',
             newline: str = '\n',
             encoding: str = 'utf8') -> typing.Generator[dict, None, None]:
-        with open(path, encoding=encoding) as f:
-            data = f.read()
-
-        return cls.load_text(data, separator, newline)
+        with open(path, encoding=encoding, newline='') as f:
+            yield from cls._read_rows(f, separator, newline)
 
     @classmethod
     def load_text(cls, data: str, separator: str = ';', newline: str = '\n') -> typing.Generator[dict, None, None]:
-        if data.startswith('\ufeff') or data.startswith('\ufffe'):
-            data = data[1:]
-
-        lines = [x.strip() for x in data.split(newline)]
-        headers = [x.strip() for x in lines[0].split(separator)]
-        for line in lines[1:]:
-            if not line:
-                continue
+        return cls._read_rows(io.StringIO(data, newline=''), separator, newline)
 
-            values = [x.strip() for x in line.split(separator)]
+    @staticmethod
+    def _read_rows(f: typing.TextIO, separator: str, newline: str) -> typing.Generator[dict, None, None]:
+        """Reads rows of a CSV file with a header line, supporting quoted cells.
 
-            kwargs = {}
-            for i, name in enumerate(headers):
-                kwargs[name] = values[i]
+        Rows are read one by one, cells are stripped and blank lines are skipped.
+        """
+        lines = f if newline in ('\n', '\r\n') else io.StringIO(f.read().replace(newline, '\n'), newline='')
+        reader = csv.reader(lines, delimiter=separator)
+        headers = None
+        for cells in reader:
+            cells = [x.strip() for x in cells]
+            if headers is None:
+                if cells and cells[0][:1] in ('\ufeff', '\ufffe'):
+                    cells[0] = cells[0][1:].strip()
+                headers = cells
+                continue
+            if not any(cells):
+                continue
 
-            yield kwargs
+            yield {name: cells[i] if i < len(cells) else '' for (i, name) in enumerate(headers)}
 
     def update(self, **kwargs):
         for (k, v) in kwargs.items():
@@ -86,8 +164,9 @@ class BaseModel(Model):
             separator: str = ';',
             newline: str = '\n',
             encoding: str = 'utf8',
-            remove_missing: bool = False
-    ):
+            remove_missing: bool = False,
+            chunk_size: int = 1000
+    ) -> dict:
         """Load settings from CSV file.
 
         :param path: Path to csv file.
@@ -95,32 +174,150 @@ class BaseModel(Model):
         :param newline: Line separator character.
         :param encoding: Encoding of CSV file.
         :param remove_missing: Delete entries missing from csv
+        :param chunk_size: Number of rows written at once.
+        :return: Statistics of the import, see `load_data`.
         """
         if path is None:
             path = f'data/import/{getattr(cls, "__tablename__")}.csv'
 
         file_data = cls.load_csv(path, separator, newline, encoding)
-        cls.load_data(file_data, remove_missing)
+        return cls.load_data(file_data, remove_missing, chunk_size)
 
     @classmethod
-    def load_data(cls, data: typing.Generator[dict, None, None], remove_missing: bool = False):
-        updated = set()
-        for model_data in data:
-            model = cls.update_or_create(**model_data)
-            if model and remove_missing:
-                updated.add(int(model.id))
-
-        if remove_missing:
-            for m in cls.query:
-                if int(m.id) not in updated:
-                    db.session.delete(m)
+    def load_data(
+            cls,
+            data: typing.Iterable[dict],
+            remove_missing: bool = False,
+            chunk_size: int = 1000) -> dict:
+        """Inserts or updates rows identified by the value of their first column.
+
+        Rows are processed in chunks: the existing rows of a chunk are found with a single query, then the new rows
+        are inserted and the existing ones updated with bulk statements, which skip ORM events and validators.
+        Models overriding `update` are written through the session instead. Empty values are left unchanged.
+
+        :param data: Rows as dictionaries of column names to values.
+        :param remove_missing: Delete rows missing from the data.
+        :param chunk_size: Number of rows written at once.
+        :return: Number of `rows` read, rows `inserted`, `updated` and `deleted`, duration in `seconds` and
+            `rows_per_second`.
+        """
+        start = tm.perf_counter()
+        stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'deleted': 0}
+        kept = None
+        try:
+            if remove_missing:
+                kept = sa.Table(f'import_{cls.__table__.name}', sa.MetaData(),
+                                sa.Column('id', sa.Integer, index=True),
+                                prefixes=['TEMPORARY'])
+                # Temporary tables outlive transactions on pooled connections, e.g. if an import failed after creating
+                # it, and are not found by `checkfirst`
+                db.session.execute(f'DROP TABLE IF EXISTS {kept.name}')
+                kept.create(db.session.connection())
+
+            key_name = None
+            chunk = {}
+            for row in data:
+                if key_name is None:
+                    key_name = next(iter(row), None)
+                key = row.get(key_name)
+                if not key:
+                    continue
+
+                stats['rows'] += 1
+                chunk.setdefault(key, {}).update({k: v for (k, v) in row.items()
+                                                  if not (isinstance(v, str) and not v)})
+                if len(chunk) >= chunk_size:
+                    cls._load_chunk(key_name, chunk, stats, kept)
+                    chunk = {}
+
+            if chunk:
+                cls._load_chunk(key_name, chunk, stats, kept)
+
+            if remove_missing:
+                missing = cls.query.filter(~cls.id.in_(sa.select([kept.c.id])))
+                if any(rel.direction is not sa.orm.interfaces.MANYTOONE for rel in sa.inspect(cls).relationships):
+                    # Let the session cascade to or detach the rows referencing them
+                    for item in missing:
+                        db.session.delete(item)
+                        stats['deleted'] += 1
+                else:
+                    stats['deleted'] = missing.delete(synchronize_session=False)
+                db.session.flush()
+                kept.drop(db.session.connection())
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        stats['seconds'] = tm.perf_counter() - start
+        stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else None
+        return stats
 
-        db.session.commit()
+    @classmethod
+    def _load_chunk(cls, key_name: str, chunk: typing.Dict[str, dict], stats: dict, kept: sa.Table = None):
+        key_column = getattr(cls, key_name)
+        if cls.update is not BaseModel.update:
+            # Values need the custom update of the model (e.g. password hashing), so rows are written through the
+            # session, which still batches the inserts
+            existing = {str(getattr(item, key_name)): item for item in cls.query.filter(key_column.in_(list(chunk)))}
+            items = []
+            for (key, values) in chunk.items():
+                item = existing.get(key)
+                if item is None:
+                    item = cls()
+                    db.session.add(item)
+                item.update(**values)
+                items.append(item)
+            db.session.flush()
+
+            if kept is not None:
+                db.session.execute(kept.insert(), [{'id': item.id} for item in items])
+            stats['inserted'] += len(items) - len(existing)
+            stats['updated'] += len(existing)
+            return
 
+        existing = {str(key): model_id for (key, model_id) in db.session.query(key_column, cls.id)
+                    .filter(key_column.in_(list(chunk)))}
+
+        inserts = []
+        updates = []
+        for (key, values) in chunk.items():
+            if key in existing:
+                updates.append(dict(values, id=existing[key]))
+            else:
+                inserts.append(values)
 
-def ordered_mixin(container_class, backref: str):
+        missing = [values for values in inserts if 'id' not in values]
+        for (values, new_id) in zip(missing, id_allocator.allocate_many(cls, len(missing))):
+            values['id'] = new_id
+
+        if inserts:
+            db.session.bulk_insert_mappings(cls, inserts)
+        if updates:
+            db.session.bulk_update_mappings(cls, updates)
+        if kept is not None:
+            db.session.execute(kept.insert(), [{'id': int(values['id'])} for values in inserts + updates])
+
+        stats['inserted'] += len(inserts)
+        stats['updated'] += len(updates)
+
+
+def ordered_mixin(container_class, backref: str, gap: int = 1):
+    """Returns a mixin ordering items in a container by their `order_number`.
+
+    With a `gap` of 1 order numbers are the positions of the items (from 1), and moving an item shifts the items
+    in between. With a larger gap order numbers are sparse keys: an item is placed between its neighbours without
+    changing other rows, and the keys are only spread again (rebalanced) when two neighbours have no room left
+    between them. Positions are derived from the keys when displaying items (see `position` and `positions`).
+
+    :param container_class: Model of the containers.
+    :param backref: Name of the relationship of the items in the container.
+    :param gap: Difference of consecutive order numbers.
+    """
     class Mixin:
         order_number = sa.Column(sa.Integer, index=True)
+        order_gap = gap
 
         @declared_attr
         def container_id(cls):
@@ -140,46 +337,332 @@ def ordered_mixin(container_class, backref: str):
 
             last = db.session.query(sa.func.max(cls.order_number))\
                 .filter(cls.container == container).first()[0]
-            return (last or 0) + 1
+            return (last or 0) + cls.order_gap
+
+        @classmethod
+        def next_position(cls, container: container_class) -> int:
+            return db.session.query(sa.func.count(cls.id)).filter(cls.container == container).scalar() + 1
+
+        @property
+        def position(self) -> int:
+            """Position of the item in its container, from 1."""
+            cls = type(self)
+            return db.session.query(sa.func.count(cls.id))\
+                .filter(cls.container_id == self.container_id)\
+                .filter(sa.or_(cls.order_number < self.order_number,
+                               sa.and_(cls.order_number == self.order_number, cls.id < self.id)))\
+                .scalar() + 1
+
+        @classmethod
+        def positions(cls, container_ids: typing.Iterable[int]) -> typing.Dict[int, int]:
+            """Returns the positions of the items of the containers by item id."""
+            container_ids = list(container_ids)
+            if not container_ids:
+                return {}
+
+            return number_items(db.session.query(cls.id, cls.container_id)
+                                .filter(cls.container_id.in_(container_ids))
+                                .order_by(cls.order_number, cls.id))
 
         def set_order(self, new: int = None):
+            """Moves the item to the given position, or after the last item.
+
+            With dense order numbers the items in between are shifted with a single update, otherwise only the
+            order number of the item changes.
+            """
             cls = type(self)
             original = self.order_number
 
             if new is None:
                 # Set as last
                 self.order_number = cls.get_next_order_number(self.container)
+                return
+
+            if cls.order_gap > 1:
+                with db.session.no_autoflush:
+                    self.order_number = self._order_key(new)
+                return
 
-            elif original is None:
+            if original is None:
                 # Insert to new and push everything after by 1
-                for item in db.session.query(cls)\
-                        .filter(cls.container == self.container)\
-                        .filter(cls.order_number >= new):
-                    if item != self:
-                        item.order_number -= 1
+                self._shift_order(new, None, 1)
 
             elif original < new:
                 # Pull everything between original and new by one
-                for item in db.session.query(cls)\
-                        .filter(cls.container == self.container)\
-                        .filter(cls.order_number > original)\
-                        .filter(cls.order_number <= new):
-                    if item != self:
-                        item.order_number -= 1
+                self._shift_order(original + 1, new, -1)
 
             elif original > new:
                 # Push everything between original and new by one
-                for item in db.session.query(cls)\
-                        .filter(cls.container == self.container)\
-                        .filter(cls.order_number < original)\
-                        .filter(cls.order_number >= new):
-                    if item != self:
-                        item.order_number += 1
+                self._shift_order(new, original - 1, 1)
+
+            self.order_number = new
+
+        def place(self):
+            """Moves the item to the position set as its order number, e.g. in a form.
+
+            Items without an order number are placed last. Nothing happens if the order number is unchanged.
+            """
+            history = sa.inspect(self).attrs.order_number.history
+            if self.order_number is not None and not history.has_changes():
+                return
+
+            position = self.order_number
+            self.order_number = history.deleted[0] if history.deleted else None
+            self.set_order(position)
+
+        def _siblings(self):
+            cls = type(self)
+            query = cls.query.filter(cls.container_id == self._container_id())
+            if self.id is not None:
+                query = query.filter(cls.id != self.id)
+            return query
+
+        def _container_id(self) -> typing.Optional[int]:
+            return self.container.id if self.container is not None else self.container_id
+
+        def _shift_order(self, start: int, end: typing.Optional[int], delta: int):
+            cls = type(self)
+            query = self._siblings().filter(cls.order_number >= start)
+            if end is not None:
+                query = query.filter(cls.order_number <= end)
+
+            values = {'order_number': cls.order_number + delta}
+            values.update(cls._moved_values(_quiz_of(self)))
+            query.update(values, synchronize_session='evaluate')
+
+        def _order_key(self, position: int) -> int:
+            """Returns a sparse order number placing the item at the position, rebalancing the keys if needed."""
+            cls = type(self)
+            keys = self._siblings()\
+                .filter(cls.order_number.isnot(None))\
+                .order_by(cls.order_number, cls.id)\
+                .with_entities(cls.order_number)
+            if position > 1:
+                neighbours = [key for (key,) in keys.offset(position - 2).limit(2)]
+                if not neighbours:
+                    return self.get_next_order_number(self.container)
+            else:
+                neighbours = [None] + [key for (key,) in keys.limit(1)]
+
+            if len(neighbours) < 2:
+                return (neighbours[0] or 0) + cls.order_gap
+            (before, after) = neighbours
+            if after - (before or 0) > 1:
+                return ((before or 0) + after) // 2
+
+            ids = [item_id for (item_id,) in self._siblings()
+                   .order_by(cls.order_number, cls.id)
+                   .with_entities(cls.id)]
+            cls._number(self._container_id(), ids, _quiz_of(self))
+            return (position - 1) * cls.order_gap + cls.order_gap // 2
+
+        @classmethod
+        def reorder(cls, container: container_class, ids: typing.List[int]) -> int:
+            """Numbers the items of a container in the given order with a single update.
+
+            :param container: Container of the items.
+            :param ids: Ids of every item of the container in the new order.
+            :return: Number of items moved.
+
+            :raise ValueError: If the ids are not the ids of the items of the container.
+            """
+            current = dict(db.session.query(cls.id, cls.order_number).filter(cls.container_id == container.id))
+            if sorted(ids) != sorted(current):
+                raise ValueError('Every item of the container must be listed once.')
+
+            return cls._number(container.id, ids, _quiz_of(container), current)
+
+        @classmethod
+        def _number(cls, container_id: int, ids: typing.List[int], quiz, current: dict = None) -> int:
+            """Sets the order numbers of items to consecutive multiples of the gap with a single update."""
+            if current is None:
+                current = dict(db.session.query(cls.id, cls.order_number).filter(cls.container_id == container_id))
+
+            keys = {item_id: (i + 1) * cls.order_gap for (i, item_id) in enumerate(ids)
+                    if current.get(item_id) != (i + 1) * cls.order_gap}
+            if not keys:
+                return 0
+
+            values = {'order_number': sa.case(keys, value=cls.id)}
+            values.update(cls._moved_values(quiz))
+            cls.query.filter(cls.id.in_(list(keys))).update(values, synchronize_session=False)
+            for item in db.session.identity_map.values():
+                if isinstance(item, cls) and item.id in keys:
+                    db.session.expire(item, list(values))
+
+            return len(keys)
+
+        @classmethod
+        def _moved_values(cls, quiz) -> dict:
+            """Returns the values stamping moved items with a new version of their quiz."""
+            if quiz is None or 'version' not in cls.__table__.c:
+                return {}
+            return {'version': quiz.new_version()}
 
     return Mixin
 
 
-db = SQLAlchemy(
+def number_items(rows: typing.Iterable[typing.Tuple[int, int]]) -> typing.Dict[int, int]:
+    """Numbers items from 1 in each container.
+
+    :param rows: Item id and container id of the items in order.
+    :return: Dictionary of item ids to positions.
+    """
+    positions = {}
+    counts = {}
+    for (item_id, container_id) in rows:
+        counts[container_id] = counts.get(container_id, 0) + 1
+        positions[item_id] = counts[container_id]
+    return positions
+
+
+def copy_rows(
+        model_class,
+        rows: typing.List[typing.Tuple[int, typing.Optional[int]]],
+        parent_column: str = None,
+        parent_ids: typing.Dict[int, int] = None,
+        chunk_size: int = 300,
+        **values) -> typing.Dict[int, int]:
+    """Copies rows of a table inside the database with an INSERT ... SELECT per chunk of rows.
+
+    The copies get new ids, and columns not given in `values` are copied, so large contents are never loaded.
+    ORM events are not triggered for the copies.
+
+    :param model_class: Model of the rows.
+    :param rows: Ids of the rows to copy, with the ids of their parents.
+    :param parent_column: Column referencing the parent of the rows, set to the copy of the parent.
+    :param parent_ids: Ids of the copies of the parents by original id.
+    :param chunk_size: Number of rows copied by a statement.
+    :param values: Values of columns of the copies.
+    :return: Ids of the copies by original id.
+    """
+    table = model_class.__table__
+    ids = dict(zip([row_id for (row_id, _) in rows], id_allocator.allocate_many(model_class, len(rows))))
+    columns = [column.name for column in table.c]
+    constants = {name: sa.literal(value, type_=table.c[name].type) if value is not None else sa.null()
+                 for (name, value) in values.items()}
+
+    for i in range(0, len(rows), chunk_size):
+        chunk = rows[i:i+chunk_size]
+        expressions = dict(constants)
+        expressions['id'] = sa.case({row_id: ids[row_id] for (row_id, _) in chunk}, value=table.c.id)
+        if parent_column is not None:
+            expressions[parent_column] = sa.case({parent_id: parent_ids[parent_id] for (_, parent_id) in chunk},
+                                                 value=table.c[parent_column])
+
+        db.session.execute(table.insert().from_select(
+            columns,
+            sa.select([expressions[name] if name in expressions else table.c[name] for name in columns])
+            .where(table.c.id.in_([row_id for (row_id, _) in chunk]))))
+
+    return ids
+
+
+def copy_questions(
+        question_ids: typing.Iterable[int],
+        section_ids: typing.Dict[int, int],
+        version: int = 0,
+        **values) -> typing.Dict[int, int]:
+    """Copies questions with their values into the copies of their sections, with batched inserts.
+
+    Copies are neither visible nor closed.
+
+    :param question_ids: Ids of the questions.
+    :param section_ids: Ids of the sections of the copies by the id of the sections of the questions.
+    :param version: Version of the copies.
+    :param values: Values of other columns of the copies, e.g. `order_number`.
+    :return: Ids of the copies by original id.
+    """
+    question_ids = list(question_ids)
+    if not question_ids:
+        return {}
+
+    rows = db.session.query(Question.id, Question.container_id).filter(Question.id.in_(question_ids)).all()
+    values = dict({'open': False, 'closed': False, 'version': version, 'scoring_changed': None}, **values)
+    ids = copy_rows(Question, rows, 'container_id', section_ids, **values)
+
+    value_rows = db.session.query(Value.id, Value.question_id).filter(Value.question_id.in_(question_ids)).all()
+    copy_rows(Value, value_rows, 'question_id', ids)
+    return ids
+
+
+def copy_sections(
+        section_ids: typing.Iterable[int],
+        quiz: typing.Optional['Quiz'],
+        **values) -> typing.Dict[int, int]:
+    """Copies sections with their questions and values into a quiz, with batched inserts.
+
+    The copies are stamped with a new version of the quiz, and are neither visible nor closed. Answers, scores
+    and likes are not copied.
+
+    :param section_ids: Ids of the sections.
+    :param quiz: Quiz of the copies.
+    :param values: Values of other columns of the copied sections, e.g. `order_number` or `user_id`.
+    :return: Ids of the copies by original id.
+    """
+    section_ids = list(section_ids)
+    if not section_ids:
+        return {}
+
+    db.session.flush()
+    version = quiz.new_version() if quiz is not None else 0
+    values = dict({'container_id': quiz.id if quiz is not None else None, 'open': False, 'closed': False,
+                   'version': version}, **values)
+    ids = copy_rows(Section, [(section_id, None) for section_id in section_ids], **values)
+
+    question_ids = [question_id for (question_id,) in db.session.query(Question.id)
+                    .filter(Question.container_id.in_(section_ids))]
+    copy_questions(question_ids, ids, version)
+    return ids
+
+
+class Database(SQLAlchemy):
+    """Flask-SQLAlchemy extension applying the engine profile of the application to SQLite databases.
+
+    When the engine of a file database is created, the `SQLITE_PRAGMAS` setting (journal mode, synchronous level,
+    busy timeout, memory map and cache size) is applied to every new connection, and if `SQLITE_POOL_SIZE` is set,
+    that many connections are kept open in a pool shared by the threads of the process. Up to `SQLITE_POOL_OVERFLOW`
+    additional connections (-1 for no limit) are opened when all of them are in use; as SQLite serializes writers
+    itself, limiting them only makes requests wait for a connection. Otherwise the defaults of Flask-SQLAlchemy are
+    used: a new connection for every session.
+    """
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        if sa_url.drivername != 'sqlite' or sa_url.database in (None, '', ':memory:'):
+            return sa_url, options
+
+        options['sqlite_pragmas'] = app.config.get('SQLITE_PRAGMAS', {})
+        pool_size = app.config.get('SQLITE_POOL_SIZE', 0)
+        if pool_size:
+            options['poolclass'] = sa.pool.QueuePool
+            options['pool_size'] = pool_size
+            options['max_overflow'] = app.config.get('SQLITE_POOL_OVERFLOW', 0)
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+        return sa_url, options
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop('sqlite_pragmas', None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            sa.event.listen(engine, 'connect', lambda connection, record: set_pragmas(connection, pragmas))
+        return engine
+
+
+def set_pragmas(connection, pragmas: typing.Dict[str, typing.Union[str, int]]):
+    """Sets pragmas on a new SQLite connection.
+
+    :param connection: DBAPI connection.
+    :param pragmas: Pragma names and values, set in order.
+    """
+    cursor = connection.cursor()
+    try:
+        for (name, value) in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+
+db = Database(
     model_class=BaseModel,
     metadata=sa.MetaData(
         naming_convention={
@@ -325,6 +808,7 @@ class Quiz(db.Model):
     end_time = db.Column(db.DateTime, index=True)
     password = db.Column(db.String(255))
     last_updated = db.Column(db.DateTime)
+    version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     hosts = db.relationship(
         "User",
@@ -337,37 +821,149 @@ class Quiz(db.Model):
         ),
         backref=db.backref("quizzes", lazy="dynamic"))
 
+    delta_versions = 100
+
     def __repr__(self) -> str:
         return self.name
 
+    def new_version(self) -> int:
+        """Increments the version of the quiz and marks it as updated.
+
+        The version is incremented in the database, so that concurrent transactions can not hand out
+        the same version. Queries are executed without flushing the session, so it can be called while flushing.
+
+        :return: New version.
+        """
+        if sa.inspect(self).persistent:
+            db.session.execute(Quiz.__table__.update()
+                               .where(Quiz.id == self.id)
+                               .values(version=sa.func.coalesce(Quiz.version, 0) + 1))
+            version = db.session.execute(sa.select([Quiz.version]).where(Quiz.id == self.id)).scalar()
+            sa.orm.attributes.set_committed_value(self, 'version', version)
+        else:
+            self.version = (self.version or 0) + 1
+
+        self.last_updated = dt.datetime.utcnow()
+        return self.version
+
+    def clone(self, name: str = None) -> 'Quiz':
+        """Copies the quiz with its hosts and password, and its sections with their questions and values.
+
+        See `copy_sections`.
+
+        :param name: Name of the copy. The name of the quiz if not given.
+        """
+        quiz = Quiz(name=name or self.name, password=self.password)
+        quiz.hosts.extend(self.hosts)
+        db.session.add(quiz)
+
+        copy_sections([section_id for (section_id,) in db.session.query(Section.id)
+                       .filter(Section.container_id == self.id)], quiz)
+        return quiz
+
+    def section_points(self) -> typing.Dict[int, dict]:
+        """Returns the stored points of every participant in every section of the quiz.
+
+        :return: Dictionary of section ids to section data with the keys `user_id` (owner of the section),
+            `closed` and `points` (dictionary of user ids to their total points in the section).
+        """
+        rows = db.session.query(
+                Section.id,
+                Section.user_id,
+                Section.closed,
+                SectionScore.user_id,
+                SectionScore.points)\
+            .select_from(SectionScore)\
+            .join(Section, SectionScore.section_id == Section.id)\
+            .filter(Section.container_id == self.id)\
+            .all()
+
+        sections = {}
+        for (section_id, owner_id, closed, user_id, points) in rows:
+            section = sections.setdefault(section_id, {'user_id': owner_id, 'closed': closed, 'points': {}})
+            section['points'][user_id] = points
+
+        return sections
+
+    @staticmethod
+    def _user_points(sections: typing.Dict[int, dict], user_id: int) -> float:
+        total = 0
+        for section in sections.values():
+            if not section['closed']:
+                continue
+
+            if section['user_id'] == user_id:
+                others = [p for (u, p) in section['points'].items() if u != user_id]
+                total += max(others) if others else 0
+            else:
+                total += section['points'].get(user_id, 0)
+
+        return total
+
     def points(self, user: User) -> float:
-        return sum([section.points(user) for section in self.sections if section.closed])
-
-    def data(
-            self,
-            user: User,
-            cached_content: list = None,
-            cached_answers: list = None,
-            include_content: bool = True
-    ) -> dict:
-        current_question = self.current_question
-        current = current_question.container if current_question else None
-        return {
+        return self._user_points(self.section_points(), user.id)
+
+    def etag(self, user: User) -> str:
+        """Returns a validator of the data of the quiz sent to the user.
+
+        It changes when the quiz is updated or the answers of the user change, and is computed with
+        a single aggregate query without loading sections or questions.
+        """
+        answers = db.session.query(sa.func.count(Answer.id), sa.func.max(Answer.timestamp))\
+            .join(Question, Answer.question_id == Question.id)\
+            .join(Section, Question.container_id == Section.id)\
+            .filter(Section.container_id == self.id)\
+            .filter(Answer.user_id == user.id)\
+            .first()
+
+        return _etag(self.id, self.last_updated, user.id, *answers)
+
+    def statistics(self) -> dict:
+        """Returns the host points and averages of the sections and questions of the quiz.
+
+        The result is memoized until the quiz is updated. See `score_statistics`.
+        """
+        key = (self.id, self.last_updated)
+        statistics = statistics_cache.get(key)
+        if statistics is None:
+            statistics = score_statistics(Section.container_id == self.id)
+            statistics_cache.set(key, statistics)
+
+        return statistics
+
+    def data(self, user: User, since: int = None) -> dict:
+        """Returns the data of the quiz shown to the user.
+
+        :param user: User to return the data for.
+        :param since: Version of the quiz last received by the user. If given, only the sections, questions and
+            ranking rows changed since are returned, with the ids of the removed ones. Everything is returned
+            (with `full` set) if the version is unknown or more than `delta_versions` versions old.
+        """
+        snapshot = QuizSnapshot.for_quiz(self)
+        data = {
             'id': self.id,
             'name': self.name,
             'start_time': self.start_time.isoformat() if self.start_time else None,
             'end_time': self.end_time.isoformat() if self.end_time else None,
-            'sections': [section.as_dict(user,
-                                         cached_content=cached_content,
-                                         cached_answers=cached_answers,
-                                         include_content=include_content
-                                                         and (section == current))
-                         for section in self.sections],
-            'points': self.points(user),
-            'user_id': user.id,
-            'rankings': self.ranking
+            'version': snapshot.version,
+            'points': self._user_points(snapshot.section_points, user.id),
+            'user_id': user.id
         }
 
+        ranking = ranking_cache.get((self.id, since)) if since is not None else None
+        if ranking is None or not snapshot.version - self.delta_versions <= since <= snapshot.version:
+            overlay = UserOverlay(user, snapshot.section_ids)
+            data.update({
+                'full': True,
+                'sections': [snapshot.section_dict(section, overlay) for section in snapshot.sections],
+                'rankings': snapshot.ranking
+            })
+        else:
+            data.update(snapshot.delta(user, since, ranking))
+            data['full'] = False
+
+        return data
+
     @property
     def current_question(self):
         return db.session.query(Question).join(Section)\
@@ -380,12 +976,20 @@ class Quiz(db.Model):
 
     @property
     def ranking(self):
-        users: list = db.session.query(User).join(Answer).join(Question).join(Section)\
+        return self._ranking(self.section_points())
+
+    def _ranking(self, sections: typing.Dict[int, dict]) -> list:
+        users = db.session.query(User.id, User.username)\
+            .join(Answer, Answer.user_id == User.id)\
+            .join(Question, Answer.question_id == Question.id)\
+            .join(Section, Question.container_id == Section.id)\
             .filter(Section.container_id == self.id)\
-            .group_by(User.id)\
+            .group_by(User.id, User.username)\
+            .order_by(User.id)\
             .all()
 
-        ranking = [{'id': u.id, 'username': u.username, 'points': self.points(u)} for u in users]
+        ranking = [{'id': user_id, 'username': username, 'points': self._user_points(sections, user_id)}
+                   for (user_id, username) in users]
         ranking.sort(key=lambda x: x['points'], reverse=True)
         rank = 1
         d = 1
@@ -400,10 +1004,11 @@ class Quiz(db.Model):
         return ranking
 
 
-class Section(db.Model, ordered_mixin(Quiz, 'sections')):
+class Section(db.Model, ordered_mixin(Quiz, 'sections', gap=1024)):
     name = name_column(unique=False)
     open = db.Column(db.Boolean, default=False)
     closed = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), index=True)
     user = db.relationship(
@@ -417,65 +1022,120 @@ class Section(db.Model, ordered_mixin(Quiz, 'sections')):
 
     def points(self, user: User) -> float:
         if user.id == self.user_id:
-            users = set()
-            for answer in Answer.query.join(Question).filter(Question.container_id == self.id):
-                if answer.user_id != user.id:
-                    users.add(answer.user)
+            return self.host_points
+
+        points = db.session.query(SectionScore.points)\
+            .filter_by(section_id=self.id, user_id=user.id)\
+            .scalar()
+        return points if points is not None else 0
+
+    @property
+    def host_points(self) -> float:
+        """Points of the owner of the section: the best result of the other users."""
+        return self.statistics()['sections'].get(self.id, {}).get('max', 0)
 
-            return max([self.points(u) for u in users]) if users else 0
+    def statistics(self) -> dict:
+        if self.container is not None:
+            return self.container.statistics()
 
-        return sum([ans.points or 0 for ans in user.answers.join(Question, Section).filter(Section.id == self.id)])
+        return score_statistics(Section.id == self.id)
 
     def calculate_points(self):
-        for answer in Answer.query.join(Question).filter(Question.container_id == self.id):
-            answer.set_points()
+        """Scores every answer in the section and stores the changed points with a single bulk update."""
+        db.session.flush()
+        matchers = AnswerMatcher.for_questions(Question.container_id == self.id)
+        changed = []
+        for (answer_id, question_id, value, points) in db.session.query(
+                    Answer.id, Answer.question_id, Answer.value, Answer.points)\
+                .join(Question, Answer.question_id == Question.id)\
+                .filter(Question.container_id == self.id):
+            new_points = matchers[question_id].points(value)
+            if new_points != points:
+                changed.append({'answer_id': answer_id, 'new_points': new_points})
+
+        if changed:
+            db.session.execute(Answer.__table__.update()
+                               .where(Answer.id == sa.bindparam('answer_id'))
+                               .values(points=sa.bindparam('new_points')),
+                               changed)
+            changed_ids = {row['answer_id'] for row in changed}
+            for item in db.session.identity_map.values():
+                if isinstance(item, Answer) and item.id in changed_ids:
+                    db.session.expire(item, ['points'])
+
+        Question.query.filter_by(container_id=self.id).update({'scoring_changed': None},
+                                                              synchronize_session='evaluate')
+        self.update_scores()
+
+    def rescoring_needed(self) -> bool:
+        """Returns whether the values or base points of a question changed after some of its answers were scored."""
+        return db.session.query(sa.exists()
+                                .where(Answer.question_id == Question.id)
+                                .where(Question.container_id == self.id)
+                                .where(Answer.timestamp <= Question.scoring_changed))\
+            .scalar()
+
+    def update_scores(self):
+        """Stores the total points of every user who answered in the section."""
+        db.session.flush()
+        SectionScore.query.filter_by(section_id=self.id).delete(synchronize_session=False)
+        db.session.execute(SectionScore.__table__.insert().from_select(
+            ['section_id', 'user_id', 'points'],
+            db.session.query(
+                    sa.literal(self.id),
+                    Answer.user_id,
+                    sa.func.sum(sa.func.coalesce(Answer.points, 0)))
+                .join(Question, Answer.question_id == Question.id)
+                .filter(Question.container_id == self.id)
+                .group_by(Answer.user_id)))
+
+        if self.container is not None:
+            # Points, host points and averages of the section and its questions change
+            version = self.container.new_version()
+            Section.query.filter_by(id=self.id).update({'version': version}, synchronize_session=False)
+            sa.orm.attributes.set_committed_value(self, 'version', version)
+            Question.query.filter_by(container_id=self.id).update({'version': version},
+                                                                   synchronize_session='evaluate')
 
     @property
     def average(self):
-        users = set()
-        for answer in Answer.query.join(Question).filter(Question.container_id == self.id):
-            if answer.user_id != answer.question.container.user_id:
-                users.add(answer.user)
-
-        total = sum([self.points(u) for u in users])
-
-        return round(total / (len(users) or 1), 2)
-
-    def as_dict(
-            self,
-            user: User,
-            cached_content: list = None,
-            cached_answers: list = None,
-            include_content: bool = True) -> dict:
-        is_host = (self.user_id == user.id) or user.has_role('admin')
-        return {
-            'id': self.id,
-            'name': self.name,
-            'order_number': self.order_number,
-            'user': self.user.username,
-            'open': True,
-            'closed': self.closed,
-            'questions': [question.as_dict(user, cached_content=cached_content,
-                                           cached_answers=cached_answers, include_content=include_content)
-                          for question in self.questions if is_host or question.open],
-            'points': self.points(user) \
-                if self.closed and self.questions.filter_by(open=False).first() is None \
-                else None,
-            'average': self.average if self.closed or is_host else None,
-            'host': is_host
-        }
+        average = self.statistics()['sections'].get(self.id, {}).get('average')
+        return round(average or 0.0, 2)
+
+    def as_dict(self, user: User) -> dict:
+        snapshot = QuizSnapshot([self])
+        return snapshot.section_dict(snapshot.sections[0], UserOverlay(user, [self.id]))
+
+    def clone(self, quiz: Quiz = None, user: User = None) -> 'Section':
+        """Copies the section with its questions and values after the last section of a quiz.
+
+        See `copy_sections`.
 
+        :param quiz: Quiz of the copy. The copy is not in any quiz if not given.
+        :param user: Owner of the copy. The owner of the section if not given.
+        """
+        values = {'order_number': Section.get_next_order_number(quiz)}
+        if user is not None:
+            values['user_id'] = user.id
+
+        ids = copy_sections([self.id], quiz, **values)
+        return Section.query.get(ids[self.id])
 
-class Question(db.Model, ordered_mixin(Section, 'questions')):
+
+class Question(db.Model, ordered_mixin(Section, 'questions', gap=1024)):
     text = db.Column(db.Text())
     content = db.deferred(db.Column(db.Text(10485760)))
     answer_content = db.deferred(db.Column(db.Text(10485760)))
+    content_hash = db.Column(db.String(64), index=True)
+    answer_content_hash = db.Column(db.String(64), index=True)
     show_values = db.Column(db.Boolean, default=False)
     max_answers = db.Column(db.Integer, default=1)
     base_points = db.Column(db.Integer, default=0)
     bonus = db.Column(db.Boolean, default=False)
     open = db.Column(db.Boolean, default=False)
     closed = db.Column(db.Boolean, default=False)
+    version = db.Column(db.Integer, default=0, server_default='0', nullable=False)
+    scoring_changed = db.Column(db.DateTime)
 
     likes = db.relationship(
         "User",
@@ -489,19 +1149,18 @@ class Question(db.Model, ordered_mixin(Section, 'questions')):
         lazy='dynamic',
         backref=db.backref("liked_questions", lazy="dynamic"))
 
+    @sa.orm.validates('content', 'answer_content')
+    def validate_content(self, key: str, value: str) -> str:
+        setattr(self, f'{key}_hash', content_hash(value))
+        return value
+
     def points(self, user: User) -> float:
         return sum([ans.points or 0 for ans in user.answers.filter_by(question_id=self.id)])
 
     @property
     def average(self):
-        users = set()
-        for answer in self.answers:
-            if answer.user_id != answer.question.container.user_id:
-                users.add(answer.user)
-
-        total = sum([self.points(u) for u in users])
-
-        return round(total / (len(users) or 1), 2)
+        average = self.container.statistics()['questions'].get(self.id)
+        return round(average or 0.0, 2)
 
     def allowed(self, user: User) -> bool:
         if self.closed:
@@ -520,64 +1179,139 @@ class Question(db.Model, ordered_mixin(Section, 'questions')):
 
         return True
 
-    def as_dict(
-            self,
-            user: User,
-            cached_content: list = None,
-            cached_answers: list = None,
-            include_content: bool = True) -> dict:
+    def etag(self, user: User) -> str:
+        """Returns a validator of the data of the question sent to the user.
 
-        if cached_content is None:
-            cached_content = []
-        if cached_answers is None:
-            cached_answers = []
+        It changes when the quiz is updated, the question is liked or the answers of the user in the section change,
+        as answers to other bonus questions of the section close the question for the user.
+        """
+        likes = Question.likes.property.secondary
+        row = db.session.query(
+                sa.select([Quiz.last_updated])
+                .select_from(sa.join(Section, Quiz, Section.container_id == Quiz.id))
+                .where(Section.id == self.container_id)
+                .as_scalar(),
+                sa.select([sa.func.count()])
+                .where(likes.c.question_id == self.id)
+                .as_scalar(),
+                sa.select([sa.func.count()])
+                .where(likes.c.question_id == self.id)
+                .where(likes.c.user_id == user.id)
+                .as_scalar(),
+                sa.func.count(Answer.id),
+                sa.func.max(Answer.timestamp))\
+            .select_from(Answer)\
+            .join(Question, Answer.question_id == Question.id)\
+            .filter(Question.container_id == self.container_id)\
+            .filter(Answer.user_id == user.id)\
+            .first()
 
-        return {
-            'id': self.id,
-            'order_number': self.order_number,
-            'text': self.text,
-            'content': self.content \
-                if include_content and self.id not in cached_content and self.open \
-                else None,
-            'answer_content': self.answer_content \
-                if include_content and self.container.closed and self.id not in cached_answers \
-                else None,
-            'max_answers': self.max_answers,
-            'base_points': self.base_points,
-            'open': self.open,
-            'closed': not self.allowed(user),
-            'likes': self.likes.count() or 0,
-            'liked': bool(user in self.likes),
-            'values': [value.text for value in self.values] if self.show_values else None,
-            'answers': {answer.value: (self.container.closed or self.closed) and answer.points
-                        for answer in self.answers.filter_by(user_id=user.id).all()},
-            'points': self.points(user) if self.container.closed else None,
-            'average': self.average if self.closed or self.container.user_id == user.id  else None,
-            'correct': [value.text for value in self.values if value.points > 0] if self.container.closed else [],
-            'host': (self.container.user_id == user.id) or user.has_role('admin'),
-            'bonus': self.bonus}
-
-    def duplicate(self):
-        question = Question(
-            content=self.content,
-            show_values=self.show_values,
-            max_answers=self.max_answers,
-            base_points=self.base_points,
-            bonus=self.bonus,
-            container_id=self.container_id,
-            order_number=Question.get_next_order_number(self.container)
-        )
-        db.session.add(question)
-        for v in self.values:
-            db.session.add(Value(
-                text=v.text,
-                allowed_misses=v.allowed_misses,
-                points=v.points,
-                order_number=v.order_number,
-                question=question))
+        return _etag(self.id, user.id, *row)
+
+    def toggle_like(self, user: User) -> typing.Tuple[bool, int]:
+        """Likes the question for the user, or removes the like, without loading the likes.
+
+        :return: Whether the user likes the question, and the number of likes.
+        """
+        likes = Question.likes.property.secondary
+        if db.session.execute(likes.delete()
+                              .where(likes.c.question_id == self.id)
+                              .where(likes.c.user_id == user.id)).rowcount:
+            liked = False
+        else:
+            db.session.execute(likes.insert().values(question_id=self.id, user_id=user.id))
+            liked = True
+
+        count = db.session.execute(sa.select([sa.func.count()]).where(likes.c.question_id == self.id)).scalar()
+        return liked, count
+
+    def as_dict(self, user: User) -> dict:
+        snapshot = QuizSnapshot([self.container], [self])
+        return snapshot.question_dict(snapshot.questions[self.container_id][0],
+                                      UserOverlay(user, [self.container_id]))
+
+    def answer_clusters(self) -> typing.List[dict]:
+        """Groups the answers of the question by their normalized text (see `normalize_answer`).
+
+        Answers are counted by value and points in the database, so only the different answers are loaded.
+
+        :return: Clusters from the largest, with the keys `text` (normalized text), `values` (different answers
+            from the most frequent), `count` (number of answers) and `points` (different points of the answers).
+        """
+        clusters = {}
+        for (value, points, count) in db.session.query(Answer.value, Answer.points, sa.func.count(Answer.id))\
+                .filter(Answer.question_id == self.id)\
+                .group_by(Answer.value, Answer.points):
+            text = normalize_answer(value or '')
+            cluster = clusters.setdefault(text, {'text': text, 'values': {}, 'count': 0, 'points': set()})
+            cluster['values'][value] = cluster['values'].get(value, 0) + count
+            cluster['count'] += count
+            cluster['points'].add(points)
+
+        return [{'text': cluster['text'],
+                 'values': sorted(cluster['values'], key=lambda v: -cluster['values'][v]),
+                 'count': cluster['count'],
+                 'points': sorted(cluster['points'], key=lambda p: (p is None, p))}
+                for cluster in sorted(clusters.values(), key=lambda c: (-c['count'], c['text']))]
+
+    def override_points(self, text: str, points: float, add_value: bool = False) -> int:
+        """Sets the points of every answer with the same normalized text with a single update.
+
+        Overrides are lost if the answers are scored again, unless they are also stored as an override value, which
+        the matcher applies to answers with the same normalized text before the other values.
+
+        :param text: Normalized text of the answers.
+        :param points: New points of the answers.
+        :param add_value: Whether to store the override as a value of the question, with the text of the most
+            frequent answer. An earlier override value of the same text is updated.
+        :return: Number of answers updated.
+        """
+        counts = {}
+        for (value, count) in db.session.query(Answer.value, sa.func.count(Answer.id))\
+                .filter(Answer.question_id == self.id)\
+                .group_by(Answer.value):
+            if normalize_answer(value or '') == text:
+                counts[value] = count
+        if not counts:
+            return 0
+
+        updated = Answer.query\
+            .filter(Answer.question_id == self.id)\
+            .filter(Answer.value.in_(list(counts)))\
+            .update({'points': points}, synchronize_session=False)
+
+        value = max(counts, key=lambda v: counts[v])
+        if add_value and value:
+            override = next((item for item in self.values.filter(Value.override == True)
+                             if normalize_answer(item.text) == text), None)
+            if override is not None:
+                override.points = points
+            else:
+                last = db.session.query(sa.func.max(Value.order_number))\
+                    .filter(Value.question_id == self.id)\
+                    .scalar()
+                db.session.add(Value(
+                    text=value,
+                    points=points,
+                    allowed_misses=0,
+                    override=True,
+                    order_number=(last or 0) + 1,
+                    question=self))
+
+        self.container.update_scores()
+        return updated
+
+    def duplicate(self) -> 'Question':
+        """Copies the question with its values after the last question of its section."""
+        db.session.flush()
+        quiz = _quiz_of(self)
+        ids = copy_questions([self.id], {self.container_id: self.container_id},
+                             version=quiz.new_version() if quiz is not None else 0,
+                             order_number=Question.get_next_order_number(self.container))
+        return Question.query.get(ids[self.id])
 
     def __repr__(self) -> str:
-        return f"{self.container.container or ''} / {self.container} / {self.order_number}."
+        return f"{self.container.container or ''} / {self.container} / {self.position}."
 
 
 class Value(db.Model):
@@ -585,6 +1319,8 @@ class Value(db.Model):
     allowed_misses = db.Column(db.Integer, default=0)
     points = db.Column(db.Float, default=1.0)
     order_number = db.Column(db.Integer, index=True)
+    # Points set for answers with the same normalized text, applied before any other value
+    override = db.Column(db.Boolean, default=False, server_default='0', nullable=False)
 
     question_id = db.Column(db.Integer, db.ForeignKey('question.id'), index=True, nullable=False)
     question = db.relationship(
@@ -616,35 +1352,773 @@ class Answer(db.Model):
     points = db.Column(db.Float, default=0)
 
     def _calculate_points(self) -> float:
-        for value in self.question.values.filter(Value.points <= 0):
-            if value.allowed_misses:
-                d = str_distance(value.text, self.value)
-                if d < value.allowed_misses:
-                    return value.points or 0
-            elif value.text == self.value:
-                return value.points
-
-        for value in self.question.values.filter(Value.points > 0):
-            val = value.text.strip().lower()\
-                .replace('the ', '')\
-                .replace('a ', '')\
-                .replace('az ', '')\
-                .replace(' ', '')\
-                .replace('-', '')
-            text = self.value.strip().lower()\
-                .replace('the ', '')\
-                .replace('a ', '')\
-                .replace('az ', '')\
-                .replace(' ', '')\
-                .replace('-', '')
-            if value.allowed_misses:
-                d = str_distance(val, text)
-                if d < value.allowed_misses:
-                    return value.points or 0
-            elif val == text:
-                return value.points
-
-        return self.question.base_points
+        return AnswerMatcher.for_question(self.question).points(self.value)
 
     def set_points(self):
         self.points = self._calculate_points()
+
+    @classmethod
+    def store(cls, submissions: typing.Sequence[typing.Tuple[int, int, str]]) -> typing.List[typing.Optional[int]]:
+        """Scores and stores answers of users, enforcing the rules of the questions with batched queries.
+
+        Answers are rejected as in `Question.allowed`: if the question is closed, or if it is a bonus question and
+        the user answered another bonus question of the section. Empty answers and answers beyond the
+        `max_answers` of the question are rejected as well. Submissions are checked in order, so earlier ones
+        count for later ones. The accepted answers are inserted with a single statement, without committing.
+
+        :param submissions: User id, question id and value of the answers.
+        :return: Ids of the stored answers, `None` for rejected ones.
+        """
+        if not submissions:
+            return []
+
+        question_ids = {question_id for (_, question_id, _) in submissions}
+        user_ids = {user_id for (user_id, _, _) in submissions}
+        questions = {row.id: row for row in db.session.query(
+                Question.id, Question.container_id, Question.closed, Question.bonus, Question.max_answers,
+                Question.version)
+            .filter(Question.id.in_(question_ids))}
+
+        counts = dict(((user_id, question_id), count) for (user_id, question_id, count) in db.session.query(
+                cls.user_id, cls.question_id, sa.func.count(cls.id))
+            .filter(cls.question_id.in_(question_ids))
+            .filter(cls.user_id.in_(user_ids))
+            .group_by(cls.user_id, cls.question_id))
+
+        answered_bonus = {}
+        bonus_sections = {question.container_id for question in questions.values() if question.bonus}
+        if bonus_sections:
+            for (user_id, section_id, question_id) in db.session.query(cls.user_id, Question.container_id, Question.id)\
+                    .join(Question, cls.question_id == Question.id)\
+                    .filter(Question.bonus == True)\
+                    .filter(Question.container_id.in_(bonus_sections))\
+                    .filter(cls.user_id.in_(user_ids))\
+                    .distinct():
+                answered_bonus.setdefault((user_id, section_id), set()).add(question_id)
+
+        matchers = {question.id: matcher_cache.get((question.id, question.version)) for question in questions.values()}
+        missing = [question_id for (question_id, matcher) in matchers.items() if matcher is None]
+        if missing:
+            for (question_id, matcher) in AnswerMatcher.for_questions(Question.id.in_(missing)).items():
+                matchers[question_id] = matcher
+                matcher_cache.set((question_id, questions[question_id].version), matcher)
+
+        now = dt.datetime.utcnow()
+        accepted = []
+        rows = []
+        for (user_id, question_id, value) in submissions:
+            question = questions.get(question_id)
+            if question is None or not value or question.closed:
+                accepted.append(False)
+                continue
+
+            bonus = answered_bonus.setdefault((user_id, question.container_id), set())
+            count = counts.get((user_id, question_id), 0)
+            if (question.bonus and bonus - {question_id}) or count >= (question.max_answers or 1):
+                accepted.append(False)
+                continue
+
+            rows.append({'value': value, 'timestamp': now, 'user_id': user_id,
+                         'question_id': question_id, 'points': matchers[question_id].points(value)})
+            accepted.append(True)
+            counts[(user_id, question_id)] = count + 1
+            if question.bonus:
+                bonus.add(question_id)
+
+        if not rows:
+            return [None] * len(accepted)
+
+        new_ids = id_allocator.allocate_many(cls, len(rows))
+        for (row, answer_id) in zip(rows, new_ids):
+            row['id'] = answer_id
+        db.session.execute(cls.__table__.insert(), rows)
+        new_ids = iter(new_ids)
+        return [next(new_ids) if is_accepted else None for is_accepted in accepted]
+
+    @classmethod
+    def clear(cls, user_id: int, question_ids: typing.Iterable[int]) -> int:
+        """Deletes the answers of a user to questions which are not closed, with a single statement.
+
+        :return: Number of answers deleted.
+        """
+        question_ids = list(question_ids)
+        if not question_ids:
+            return 0
+
+        return cls.query\
+            .filter(cls.user_id == user_id)\
+            .filter(cls.question_id.in_(sa.select([Question.id])
+                                        .where(Question.id.in_(question_ids))
+                                        .where(Question.closed == False)))\
+            .delete(synchronize_session=False)
+
+
+def bounded_distance(a: str, b: str, bound: int) -> int:
+    """Returns the edit distance of two texts, or any number above `bound` if it is larger.
+
+    The computation stops early once the bound is exceeded if the installed Levenshtein package supports it.
+    """
+    return str_distance(a, b, score_cutoff=bound)
+
+
+try:
+    str_distance('', '', score_cutoff=0)
+except TypeError:
+    def bounded_distance(a: str, b: str, bound: int) -> int:
+        return str_distance(a, b)
+
+
+def normalize_answer(text: str) -> str:
+    """Normalizes an answer or value for comparison: articles, spaces and dashes are removed."""
+    return text.strip().lower()\
+        .replace('the ', '')\
+        .replace('a ', '')\
+        .replace('az ', '')\
+        .replace(' ', '')\
+        .replace('-', '')
+
+
+class AnswerMatcher:
+    """Scores the answers of a question, with its values loaded and normalized once.
+
+    Overrides set by the hosts for answers with the same normalized text (see `normalize_answer`) come first.
+    Otherwise values with no points or less (penalties) are compared to the answer as they are, the rest after
+    normalization. The first matching value in order determines the points, penalties first, otherwise the base
+    points of the question are given. A value matches if the answer is within less than its `allowed_misses` edits
+    of it, or if it is equal when no misses are allowed.
+
+    :param base_points: Points given if no value matches.
+    :param values: Text, allowed misses and points of the values in order.
+    :param overrides: Points by the normalized text of answers.
+    """
+    def __init__(self, base_points: int, values: typing.List[typing.Tuple[str, int, float]],
+                 overrides: typing.Dict[str, float] = None):
+        self.base_points = base_points
+        self.overrides = overrides or {}
+        self.penalties = self._compile([(text, misses, points) for (text, misses, points) in values
+                                        if points is not None and points <= 0])
+        self.accepted = self._compile([(normalize_answer(text), misses, points) for (text, misses, points) in values
+                                       if points is not None and points > 0])
+
+    @staticmethod
+    def _compile(values: list) -> tuple:
+        """Indexes values for matching.
+
+        Exact matches are kept in a dictionary, and approximate ones in buckets by length, as the edit distance of
+        texts is at least the difference of their lengths. Both keep the position of the value, so that the first
+        match can be found.
+        """
+        approximate = {}
+        exact = {}
+        max_misses = 0
+        for (i, (text, misses, points)) in enumerate(values):
+            if misses:
+                approximate.setdefault(len(text), []).append((i, text, misses, points or 0))
+                max_misses = max(max_misses, misses)
+            elif text not in exact:
+                exact[text] = (i, points)
+        return approximate, exact, max_misses
+
+    @staticmethod
+    def _match(values: tuple, text: str) -> typing.Optional[float]:
+        approximate, exact, max_misses = values
+        (limit, points) = exact.get(text, (float('inf'), None))
+
+        length = len(text)
+        candidates = []
+        for value_length in range(max(length - max_misses + 1, 0), length + max_misses):
+            for value in approximate.get(value_length, ()):
+                if value[0] < limit and abs(value_length - length) < value[2]:
+                    candidates.append(value)
+
+        candidates.sort()
+        for (i, value, misses, value_points) in candidates:
+            if bounded_distance(value, text, misses - 1) < misses:
+                return value_points
+        return points
+
+    def points(self, answer: str) -> float:
+        if self.overrides:
+            normalized = normalize_answer(answer)
+            if normalized in self.overrides:
+                return self.overrides[normalized]
+
+        points = self._match(self.penalties, answer)
+        if points is None and any(self.accepted):
+            points = self._match(self.accepted, normalize_answer(answer))
+        return self.base_points if points is None else points
+
+    @classmethod
+    def for_question(cls, question: 'Question') -> 'AnswerMatcher':
+        """Returns the matcher of the current version of a question, compiled once per version."""
+        key = (question.id, question.version)
+        matcher = matcher_cache.get(key)
+        if matcher is None:
+            matcher = cls.for_questions(Question.id == question.id)[question.id]
+            matcher_cache.set(key, matcher)
+        return matcher
+
+    @classmethod
+    def for_questions(cls, *criteria) -> typing.Dict[int, 'AnswerMatcher']:
+        """Compiles the matchers of questions with a single query.
+
+        :param criteria: Filters on `Question` selecting the questions.
+        :return: Dictionary of question ids to matchers.
+        """
+        rows = db.session.query(Question.id, Question.base_points, Value.text, Value.allowed_misses, Value.points,
+                                Value.override)\
+            .outerjoin(Value, Value.question_id == Question.id)\
+            .filter(*criteria)\
+            .order_by(Question.id, Value.order_number)
+
+        questions = {}
+        for (question_id, base_points, text, misses, points, override) in rows:
+            (_, values, overrides) = questions.setdefault(question_id, (base_points, [], {}))
+            if text is None:
+                continue
+            if override:
+                overrides.setdefault(normalize_answer(text), points)
+            else:
+                values.append((text, misses, points))
+
+        return {question_id: cls(base_points, values, overrides)
+                for (question_id, (base_points, values, overrides)) in questions.items()}
+
+
+class SectionScore(db.Model):
+    id = None
+    points = db.Column(db.Float, default=0)
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    user = db.relationship(
+        User,
+        backref=(db.backref('section_scores',
+                            lazy='dynamic',
+                            cascade='delete, delete-orphan')))
+
+    section_id = db.Column(db.Integer, db.ForeignKey('section.id'), primary_key=True)
+    section = db.relationship(
+        Section,
+        backref=(db.backref('scores',
+                            lazy='dynamic',
+                            cascade='delete, delete-orphan')))
+
+
+class Tombstone(db.Model):
+    """Section or question removed from a quiz, reported to clients receiving changes since an earlier version."""
+    kind = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, index=True)
+
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), index=True)
+    quiz = db.relationship(
+        Quiz,
+        backref=(db.backref('tombstones',
+                            lazy='dynamic',
+                            cascade='delete, delete-orphan')))
+
+
+
+class RescoringRun(db.Model):
+    """Rescoring job, stored so that every worker process sees it and at most one job runs at a time.
+
+    A pending or running job whose `heartbeat` is older than `stale_after` is considered abandoned, e.g. because
+    its process exited.
+    """
+    stale_after = dt.timedelta(minutes=10)
+
+    quiz_id = db.Column(db.Integer, db.ForeignKey('quiz.id'), nullable=True)
+    status = db.Column(db.String(16), nullable=False, default='pending', index=True)
+    total = db.Column(db.Integer)
+    processed = db.Column(db.Integer, default=0)
+    changed = db.Column(db.Integer, default=0)
+    sections = db.Column(db.Integer, default=0)
+    created = db.Column(db.DateTime, default=dt.datetime.utcnow, index=True)
+    started = db.Column(db.DateTime)
+    finished = db.Column(db.DateTime)
+    heartbeat = db.Column(db.DateTime)
+    error = db.Column(db.Text)
+
+    @classmethod
+    def claim(cls, quiz_id: int = None) -> typing.Optional[int]:
+        """Creates a pending job unless a job is running, with a single statement.
+
+        :param quiz_id: Only rescore the answers of this quiz.
+        :return: ID of the new job, or `None` if a job is already running.
+        """
+        now = dt.datetime.utcnow()
+        run_id = id_allocator.allocate(cls)
+        running = sa.exists()\
+            .where(cls.status.in_(['pending', 'running']))\
+            .where(cls.heartbeat > now - cls.stale_after)
+        columns = ['id', 'quiz_id', 'status', 'processed', 'changed', 'sections', 'created', 'heartbeat']
+        values = [run_id, quiz_id, 'pending', 0, 0, 0, now, now]
+        result = db.session.execute(cls.__table__.insert().from_select(
+            columns, sa.select([sa.literal(value) for value in values]).where(~running)))
+        db.session.commit()
+        return run_id if result.rowcount else None
+
+    @classmethod
+    def latest(cls) -> typing.Optional['RescoringRun']:
+        return cls.query.order_by(cls.created.desc()).first()
+
+    def as_dict(self) -> dict:
+        return {
+            'status': self.status,
+            'quiz_id': self.quiz_id,
+            'total': self.total,
+            'processed': self.processed,
+            'changed': self.changed,
+            'sections': self.sections,
+            'progress': round(self.processed / self.total, 4) if self.total else None,
+            'started': self.started.isoformat() if self.started else None,
+            'finished': self.finished.isoformat() if self.finished else None,
+            'error': self.error
+        }
+
+class QuizSnapshot:
+    """Data of sections and questions shared by every user.
+
+    Everything is loaded in bulk with a fixed number of queries, regardless of the size of the quiz, and only
+    plain data is kept, so that snapshots can be cached between requests. Data specific to a user is added
+    from a `UserOverlay` when serializing.
+
+    :param sections: Sections to load.
+    :param questions: Questions to load. All questions of the sections if not given.
+    """
+    def __init__(self, sections: typing.List[Section], questions: typing.List[Question] = None):
+        self.section_ids = [section.id for section in sections]
+        self.version = None
+        self.ranking = None
+        self.tombstones = []
+
+        if questions is None:
+            questions = Question.query\
+                .filter(Question.container_id.in_(self.section_ids))\
+                .order_by(Question.order_number, Question.id)\
+                .all() if self.section_ids else []
+            question_positions = number_items((question.id, question.container_id) for question in questions)
+        else:
+            question_positions = Question.positions(self.section_ids)
+        section_positions = Section.positions({section.container_id for section in sections
+                                               if section.container_id is not None})
+
+        values = {}
+        question_ids = [question.id for question in questions]
+        if question_ids:
+            for (question_id, text, points) in db.session.query(Value.question_id, Value.text, Value.points)\
+                    .filter(Value.question_id.in_(question_ids))\
+                    .filter(Value.override == False)\
+                    .order_by(Value.order_number):
+                values.setdefault(question_id, []).append((text, points))
+
+        scores = {}
+        if self.section_ids:
+            for (section_id, user_id, points) in db.session.query(
+                        SectionScore.section_id, SectionScore.user_id, SectionScore.points)\
+                    .filter(SectionScore.section_id.in_(self.section_ids)):
+                scores.setdefault(section_id, {})[user_id] = points
+
+        self.sections = [{
+            'id': section.id,
+            'name': section.name,
+            'order_number': section_positions.get(section.id, section.order_number),
+            'user': section.user.username,
+            'user_id': section.user_id,
+            'closed': section.closed,
+            'host_points': section.host_points,
+            'average': section.average,
+            'version': section.version or 0
+        } for section in sections]
+        self._sections = {section['id']: section for section in self.sections}
+        self.section_points = {section.id: {'user_id': section.user_id,
+                                            'closed': section.closed,
+                                            'points': scores.get(section.id, {})}
+                               for section in sections}
+
+        self.questions = {section_id: [] for section_id in self.section_ids}
+        for question in questions:
+            self.questions.setdefault(question.container_id, []).append({
+                'id': question.id,
+                'section_id': question.container_id,
+                'order_number': question_positions.get(question.id, question.order_number),
+                'text': question.text,
+                'max_answers': question.max_answers,
+                'base_points': question.base_points,
+                'open': question.open,
+                'closed': question.closed,
+                'bonus': question.bonus,
+                'show_values': question.show_values,
+                'content_hash': question.content_hash,
+                'answer_content_hash': question.answer_content_hash,
+                'values': [text for (text, points) in values.get(question.id, [])],
+                'correct': [text for (text, points) in values.get(question.id, []) if points > 0],
+                'average': question.average,
+                'version': question.version or 0
+            })
+
+    @classmethod
+    def for_quiz(cls, quiz: Quiz) -> 'QuizSnapshot':
+        """Returns the snapshot of the current version of a quiz, including its ranking and tombstones."""
+        key = (quiz.id, quiz.version, quiz.last_updated)
+        snapshot = snapshot_cache.get(key)
+        if snapshot is None:
+            sections = Section.query\
+                .options(sa.orm.joinedload(Section.user))\
+                .filter(Section.container_id == quiz.id)\
+                .order_by(Section.order_number, Section.id)\
+                .all()
+            snapshot = cls(sections)
+            snapshot.version = quiz.version or 0
+            snapshot.ranking = quiz._ranking(snapshot.section_points)
+            snapshot.tombstones = db.session.query(Tombstone.kind, Tombstone.entity_id, Tombstone.version)\
+                .filter(Tombstone.quiz_id == quiz.id)\
+                .all()
+            snapshot_cache.set(key, snapshot)
+            ranking_cache.set((quiz.id, snapshot.version), snapshot.ranking)
+
+        return snapshot
+
+    def section(self, section_id: int) -> dict:
+        return self._sections[section_id]
+
+    def section_dict(self, section: dict, overlay: 'UserOverlay', include_questions: bool = True) -> dict:
+        user = overlay.user
+        is_host = (section['user_id'] == user.id) or overlay.is_admin
+        questions = self.questions[section['id']]
+
+        if section['user_id'] == user.id:
+            points = section['host_points']
+        else:
+            points = self.section_points[section['id']]['points'].get(user.id, 0)
+
+        data = {
+            'id': section['id'],
+            'name': section['name'],
+            'order_number': section['order_number'],
+            'user': section['user'],
+            'open': True,
+            'closed': section['closed'],
+            'points': points \
+                if section['closed'] and not any(question['open'] is False for question in questions) \
+                else None,
+            'average': section['average'] if section['closed'] or is_host else None,
+            'host': is_host
+        }
+        if include_questions:
+            data['questions'] = [self.question_dict(question, overlay)
+                                 for question in questions if is_host or question['open']]
+
+        return data
+
+    def delta(self, user: User, since: int, ranking: list) -> dict:
+        """Returns the changes of the snapshot since an earlier version of the quiz.
+
+        :param user: User to return the data for.
+        :param since: Earlier version of the quiz.
+        :param ranking: Ranking of the earlier version.
+        :return: Dictionary with the changed `sections` (without their questions), `questions` and `rankings`
+            rows, and the ids of the removed ones in `removed_sections`, `removed_questions` and
+            `removed_rankings`. Questions hidden from the user since are reported as removed. As positions are
+            derived from the order of the items, the current positions of the sections (if any section changed)
+            and of the questions of the changed sections are returned in `section_positions` and
+            `question_positions`.
+        """
+        sections = [section for section in self.sections if section['version'] > since]
+        questions = [question for section_id in self.section_ids for question in self.questions[section_id]
+                     if question['version'] > since]
+        overlay = UserOverlay(user, sorted({question['section_id'] for question in questions}))
+
+        removed = {'section': [], 'question': []}
+        for (kind, entity_id, version) in self.tombstones:
+            if version > since:
+                removed.setdefault(kind, []).append(entity_id)
+
+        visible = []
+        for question in questions:
+            section = self.section(question['section_id'])
+            if question['open'] or section['user_id'] == user.id or overlay.is_admin:
+                visible.append(self.question_dict(question, overlay))
+            else:
+                removed['question'].append(question['id'])
+
+        section_positions = {}
+        if sections or removed['section']:
+            section_positions = {section['id']: section['order_number'] for section in self.sections}
+        question_positions = {}
+        for section_id in {section['id'] for section in sections} | {question['section_id'] for question in questions}:
+            is_host = self.section(section_id)['user_id'] == user.id or overlay.is_admin
+            question_positions.update({question['id']: question['order_number']
+                                       for question in self.questions[section_id] if is_host or question['open']})
+
+        old_rows = {row['id']: row for row in ranking}
+        new_ids = {row['id'] for row in self.ranking}
+
+        return {
+            'since': since,
+            'sections': [self.section_dict(section, overlay, include_questions=False) for section in sections],
+            'questions': visible,
+            'rankings': [row for row in self.ranking if old_rows.get(row['id']) != row],
+            'removed_sections': removed['section'],
+            'removed_questions': removed['question'],
+            'removed_rankings': [user_id for user_id in old_rows if user_id not in new_ids],
+            'section_positions': section_positions,
+            'question_positions': question_positions
+        }
+
+    def question_dict(self, question: dict, overlay: 'UserOverlay') -> dict:
+        user = overlay.user
+        section = self.section(question['section_id'])
+        answers = overlay.answers.get(question['id'], [])
+
+        return {
+            'id': question['id'],
+            'section_id': question['section_id'],
+            'order_number': question['order_number'],
+            'text': question['text'],
+            'content_hash': question['content_hash'] if question['open'] else None,
+            'answer_content_hash': question['answer_content_hash'] if section['closed'] else None,
+            'max_answers': question['max_answers'],
+            'base_points': question['base_points'],
+            'open': question['open'],
+            'closed': not overlay.allowed(question),
+            'likes': overlay.likes.get(question['id'], 0),
+            'liked': question['id'] in overlay.liked,
+            'values': question['values'] if question['show_values'] else None,
+            'answers': {value: (section['closed'] or question['closed']) and points for (value, points) in answers},
+            'points': sum([points or 0 for (value, points) in answers]) if section['closed'] else None,
+            'average': question['average'] if question['closed'] or section['user_id'] == user.id else None,
+            'correct': question['correct'] if section['closed'] else [],
+            'host': (section['user_id'] == user.id) or overlay.is_admin,
+            'bonus': question['bonus']}
+
+
+class UserOverlay:
+    """Answers and likes of a user, and the like counts of questions, loaded with a single query.
+
+    :param user: User to load the data of.
+    :param section_ids: Sections to load the data from.
+    """
+    def __init__(self, user: User, section_ids: typing.List[int]):
+        self.user = user
+        self.is_admin = user.has_role('admin')
+        self.answers = {}
+        self.bonus_answers = {}
+        self.liked = set()
+        self.likes = {}
+
+        if not section_ids:
+            return
+
+        likes = Question.likes.property.secondary
+        answers = db.session.query(
+                sa.literal(0), Answer.question_id, Question.container_id, Question.bonus,
+                Answer.value, Answer.points, Answer.id)\
+            .join(Question, Answer.question_id == Question.id)\
+            .filter(Question.container_id.in_(section_ids))\
+            .filter(Answer.user_id == user.id)
+        liked = db.session.query(
+                sa.literal(1), likes.c.question_id, Question.container_id, sa.null(),
+                sa.null(), sa.null(), sa.null())\
+            .join(Question, likes.c.question_id == Question.id)\
+            .filter(Question.container_id.in_(section_ids))\
+            .filter(likes.c.user_id == user.id)
+        counts = db.session.query(
+                sa.literal(2), likes.c.question_id, Question.container_id, sa.null(),
+                sa.null(), sa.func.count(likes.c.user_id), sa.null())\
+            .join(Question, likes.c.question_id == Question.id)\
+            .filter(Question.container_id.in_(section_ids))\
+            .group_by(likes.c.question_id, Question.container_id)
+
+        user_answers = []
+        for (kind, question_id, section_id, bonus, value, points, answer_id) in answers.union_all(liked, counts):
+            if kind == 0:
+                user_answers.append((answer_id, question_id, value, points))
+                if bonus:
+                    self.bonus_answers.setdefault(section_id, set()).add(question_id)
+            elif kind == 1:
+                self.liked.add(question_id)
+            else:
+                self.likes[question_id] = int(points)
+
+        for (answer_id, question_id, value, points) in sorted(user_answers):
+            self.answers.setdefault(question_id, []).append((value, points))
+
+    def allowed(self, question: dict) -> bool:
+        """Same as `Question.allowed`."""
+        if question['closed']:
+            return False
+
+        if question['bonus'] and self.bonus_answers.get(question['section_id'], set()) - {question['id']}:
+            return False
+
+        return True
+
+
+def content_hash(content: typing.Optional[str]) -> typing.Optional[str]:
+    """Returns the key of question contents served by the content endpoint."""
+    return hashlib.sha256(content.encode()).hexdigest() if content else None
+
+
+def _etag(*parts) -> str:
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+statistics_cache = LRUCache(128)
+snapshot_cache = LRUCache(32)
+ranking_cache = LRUCache(256)
+matcher_cache = LRUCache(512)
+
+
+def _section_of(question: Question) -> typing.Optional[Section]:
+    if question is None:
+        return None
+    return question.container or (Section.query.get(question.container_id) if question.container_id else None)
+
+
+def _quiz_of(item: typing.Union[Quiz, Section, Question, Value, None]) -> typing.Optional[Quiz]:
+    """Returns the quiz of a section, question or value, also if only the foreign keys of the item are set."""
+    if isinstance(item, Quiz):
+        return item
+    if isinstance(item, Value):
+        item = item.question or (Question.query.get(item.question_id) if item.question_id else None)
+    if isinstance(item, Question):
+        item = _section_of(item)
+    if item is None:
+        return None
+    return item.container or (Quiz.query.get(item.container_id) if item.container_id else None)
+
+
+@sa.event.listens_for(db.session, 'before_flush')
+def assign_ids(session, flush_context, instances):
+    """Sets the ids of new rows before flushing, so that their inserts can be executed in batches.
+
+    The ids of the new rows of a table are checked against the table with a single query.
+    """
+    new = {}
+    for item in session.new:
+        if isinstance(item, BaseModel) and 'id' in item.__table__.c and item.id is None:
+            new.setdefault(type(item), []).append(item)
+
+    for (model_class, items) in new.items():
+        for (item, new_id) in zip(items, id_allocator.allocate_many(model_class, len(items))):
+            item.id = new_id
+
+
+@sa.event.listens_for(db.session, 'before_flush')
+def stamp_versions(session, flush_context, instances):
+    """Stamps the sections and questions changed in the flush with a new version of their quiz.
+
+    Changed values stamp their question, and changed questions their section. Removing a section or question,
+    or moving it to another quiz, leaves a tombstone in the quiz it was removed from.
+
+    Changes of values or base points are also recorded in `Question.scoring_changed`, so that the answers
+    scored before can be scored again when the section is closed.
+    """
+    changed = {}
+    removed = {}
+    now = dt.datetime.utcnow()
+
+    def mark(item, quiz):
+        if item is not None and quiz is not None:
+            changed.setdefault(quiz, set()).add(item)
+
+    for item in list(session.new) + [i for i in session.dirty if session.is_modified(i, include_collections=False)]:
+        if isinstance(item, Value):
+            question = item.question or (Question.query.get(item.question_id) if item.question_id else None)
+            quiz = _quiz_of(question)
+            mark(question, quiz)
+            mark(_section_of(question), quiz)
+            if question is not None and question not in session.new:
+                question.scoring_changed = now
+        elif isinstance(item, (Section, Question)):
+            quiz = _quiz_of(item)
+            mark(item, quiz)
+            if isinstance(item, Question):
+                mark(_section_of(item), quiz)
+                if item not in session.new and sa.inspect(item).attrs.base_points.history.has_changes():
+                    item.scoring_changed = now
+
+            attrs = sa.inspect(item).attrs
+            old_container_ids = set(attrs.container_id.history.deleted or ())
+            if attrs.container.history.has_changes():
+                old_container_ids.update(container.id for container in attrs.container.history.deleted or ()
+                                         if container is not None)
+                if not attrs.container_id.history.has_changes():
+                    # Moved through the relationship, the foreign key is only synced in the flush
+                    old_container_ids.add(item.container_id)
+            old_container_ids.discard(None)
+            for old_container_id in old_container_ids:
+                if isinstance(item, Section):
+                    old_quiz = Quiz.query.get(old_container_id)
+                else:
+                    old_section = Section.query.get(old_container_id)
+                    old_quiz = _quiz_of(old_section)
+                    mark(old_section, old_quiz)
+
+                if old_quiz is not None and old_quiz is not quiz:
+                    removed.setdefault(old_quiz, set()).add(item)
+
+    for item in session.deleted:
+        if isinstance(item, (Section, Question)):
+            quiz = _quiz_of(item)
+            if quiz is not None:
+                removed.setdefault(quiz, set()).add(item)
+            if isinstance(item, Question):
+                mark(item.container, quiz)
+        elif isinstance(item, Value) and item.question is not None:
+            mark(item.question, _quiz_of(item.question))
+            item.question.scoring_changed = now
+
+    for quiz in set(changed) | set(removed):
+        if quiz in session.deleted:
+            continue
+
+        version = quiz.new_version()
+        for item in changed.get(quiz, ()):
+            if item is not None and item not in session.deleted:
+                item.version = version
+        for item in removed.get(quiz, ()):
+            session.add(Tombstone(kind=type(item).__name__.lower(), entity_id=item.id, version=version, quiz=quiz))
+        if removed.get(quiz) and sa.inspect(quiz).persistent:
+            session.execute(Tombstone.__table__.delete()
+                            .where(Tombstone.quiz_id == quiz.id)
+                            .where(Tombstone.version <= version - Quiz.delta_versions))
+
+
+def score_statistics(*criteria) -> dict:
+    """Computes the host points and averages of sections and questions with two aggregate queries.
+
+    Answers of the owner of a section are left out of both the maximums and the averages.
+
+    :param criteria: Filters on `Section` selecting the sections to compute.
+    :return: Dictionary with the keys `sections` (section ids to dictionaries with the keys `max` and `average`)
+        and `questions` (question ids to their average points).
+    """
+    not_owner = sa.or_(Section.user_id.is_(None), SectionScore.user_id != Section.user_id)
+    sections = db.session.query(
+            SectionScore.section_id,
+            sa.func.max(SectionScore.points),
+            sa.func.avg(SectionScore.points))\
+        .join(Section, SectionScore.section_id == Section.id)\
+        .filter(not_owner, *criteria)\
+        .group_by(SectionScore.section_id)\
+        .all()
+
+    per_user = db.session.query(
+            Answer.question_id.label('question_id'),
+            sa.func.sum(sa.func.coalesce(Answer.points, 0)).label('points'))\
+        .join(Question, Answer.question_id == Question.id)\
+        .join(Section, Question.container_id == Section.id)\
+        .filter(sa.or_(Section.user_id.is_(None), Answer.user_id != Section.user_id), *criteria)\
+        .group_by(Answer.question_id, Answer.user_id)\
+        .subquery()
+    questions = db.session.query(per_user.c.question_id, sa.func.avg(per_user.c.points))\
+        .group_by(per_user.c.question_id)\
+        .all()
+
+    return {
+        'sections': {section_id: {'max': max_points, 'average': average}
+                     for (section_id, max_points, average) in sections},
+        'questions': dict(questions)
+    }
@@ -0,0 +1,205 @@
+import concurrent.futures
+import datetime as dt
+import multiprocessing
+import threading
+import typing
+
+from flask import current_app
+import sqlalchemy as sa
+
+import model as md
+
+
+def score_batch(batch: typing.Tuple[typing.Dict[int, md.AnswerMatcher], list]) -> typing.List[tuple]:
+    """Scores answers in a worker process.
+
+    :param batch: Matchers of the questions, and answer id, question id and value of the answers.
+    :return: Answer ids and points.
+    """
+    matchers, answers = batch
+    return [(answer_id, matchers[question_id].points(value)) for (answer_id, question_id, value) in answers]
+
+
+class RescoringJob:
+    """Scores answers again in a background thread.
+
+    Answers are read in chunks ordered by id, scored in a process pool and committed chunk by chunk, so the
+    database is not locked for the whole run. The section scores of the rescored sections are updated at the end.
+    The progress is stored in the `RescoringRun` of the job with every chunk.
+
+    Worker processes are started with the spawn method: forking the multithreaded web process could copy locks
+    held by other threads and the pooled database connections into the workers. Workers only score, they do not
+    use the database.
+
+    :param app: Application to run the job in.
+    :param run_id: ID of the `RescoringRun` of the job.
+    :param quiz_id: Only rescore the answers of this quiz.
+    :param chunk_size: Number of answers per chunk.
+    :param processes: Number of worker processes. Answers are scored in the thread of the job if 0 or 1.
+    """
+    max_matchers = 10000
+
+    def __init__(self, app, run_id: int, quiz_id: int = None, chunk_size: int = 1000, processes: int = 2):
+        self.app = app
+        self.run_id = run_id
+        self.quiz_id = quiz_id
+        self.chunk_size = chunk_size
+        self.processes = processes
+        self.status = 'pending'
+        self.total = None
+        self.processed = 0
+        self.changed = 0
+        self.sections = 0
+        self.started = None
+        self.finished = None
+        self.error = None
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self.status in ('pending', 'running')
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='rescoring', daemon=True)
+        self._thread.start()
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        with self.app.app_context():
+            self.started = dt.datetime.utcnow()
+            self.status = 'running'
+            try:
+                self._save()
+                md.db.session.commit()
+                self._run()
+                self.status = 'done'
+            except Exception as e:
+                md.db.session.rollback()
+                self.app.logger.exception('Rescoring failed')
+                self.status = 'failed'
+                self.error = str(e)
+            finally:
+                self.finished = dt.datetime.utcnow()
+                self._save()
+                md.db.session.commit()
+                md.db.session.remove()
+
+    def _save(self):
+        """Stores the progress of the job in its run, in the current transaction."""
+        md.db.session.execute(md.RescoringRun.__table__.update()
+                              .where(md.RescoringRun.id == self.run_id)
+                              .values(status=self.status, total=self.total, processed=self.processed,
+                                      changed=self.changed, sections=self.sections, started=self.started,
+                                      finished=self.finished, error=self.error, heartbeat=dt.datetime.utcnow()))
+
+    def _run(self):
+        query = md.db.session.query(md.Answer.id, md.Answer.question_id, md.Answer.value, md.Answer.points,
+                                    md.Question.container_id)\
+            .join(md.Question, md.Answer.question_id == md.Question.id)
+        if self.quiz_id is not None:
+            query = query.join(md.Section, md.Question.container_id == md.Section.id)\
+                .filter(md.Section.container_id == self.quiz_id)
+
+        self.total = query.count()
+        self._save()
+        md.db.session.commit()
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('spawn')) if self.processes > 1 else None
+        matchers = {}
+        section_ids = set()
+        last_id = None
+        try:
+            while True:
+                chunk = query.filter(md.Answer.id > last_id) if last_id is not None else query
+                answers = chunk.order_by(md.Answer.id).limit(self.chunk_size).all()
+                if not answers:
+                    break
+
+                last_id = answers[-1][0]
+                question_ids = {question_id for (_, question_id, _, _, _) in answers}
+                if len(matchers) > self.max_matchers:
+                    matchers.clear()
+                missing = question_ids - set(matchers)
+                if missing:
+                    matchers.update(md.AnswerMatcher.for_questions(md.Question.id.in_(missing)))
+
+                points = dict(self._score(executor, matchers, answers))
+                changed = [{'answer_id': answer_id, 'new_points': points[answer_id]}
+                           for (answer_id, _, _, old_points, _) in answers if points[answer_id] != old_points]
+                if changed:
+                    md.db.session.execute(md.Answer.__table__.update()
+                                          .where(md.Answer.id == sa.bindparam('answer_id'))
+                                          .values(points=sa.bindparam('new_points')),
+                                          changed)
+
+                section_ids.update(section_id for (_, _, _, _, section_id) in answers)
+                self.processed += len(answers)
+                self.changed += len(changed)
+                self._save()
+                md.db.session.commit()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        for section_id in sorted(section_ids):
+            section = md.Section.query.get(section_id)
+            if section is not None:
+                section.update_scores()
+            self.sections += 1
+            self._save()
+            md.db.session.commit()
+
+    def _score(self, executor, matchers: dict, answers: list) -> typing.Iterable[tuple]:
+        if executor is None:
+            return score_batch((matchers, [(answer_id, question_id, value)
+                                           for (answer_id, question_id, value, _, _) in answers]))
+
+        size = -(-len(answers) // self.processes)
+        batches = []
+        for i in range(0, len(answers), size):
+            part = answers[i:i+size]
+            batches.append(({question_id: matchers[question_id] for (_, question_id, _, _, _) in part},
+                            [(answer_id, question_id, value) for (answer_id, question_id, value, _, _) in part]))
+        return [row for result in executor.map(score_batch, batches) for row in result]
+
+
+class Rescoring:
+    """Runs at most one rescoring job at a time.
+
+    Jobs are stored as `RescoringRun` rows, so the limit and the status are shared by the worker processes. Chunk
+    size and number of processes are read from the `RESCORING_CHUNK_SIZE` and `RESCORING_PROCESSES` settings.
+    """
+    def __init__(self):
+        self.job = None
+
+    def start(self, quiz_id: int = None) -> typing.Optional[RescoringJob]:
+        """Starts a job in this process unless a job is running in any process.
+
+        :param quiz_id: Only rescore the answers of this quiz.
+        :return: The started job, or `None` if a job is already running.
+        """
+        run_id = md.RescoringRun.claim(quiz_id)
+        if run_id is None:
+            return None
+
+        self.job = RescoringJob(
+            current_app._get_current_object(),
+            run_id,
+            quiz_id=quiz_id,
+            chunk_size=current_app.config.get('RESCORING_CHUNK_SIZE', 1000),
+            processes=current_app.config.get('RESCORING_PROCESSES', 2))
+        self.job.start()
+        return self.job
+
+    @staticmethod
+    def status() -> typing.Optional[dict]:
+        """Returns the state of the last job started in any process."""
+        run = md.RescoringRun.latest()
+        return run.as_dict() if run is not None else None
+
+
+rescoring = Rescoring()
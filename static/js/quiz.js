@@ -1,18 +1,35 @@
 const CONTENT_CACHE = {};
-const ANSWER_CONTENT_CACHE = {};
 var autoRefresh = true;
+var eventSource = null;
+var quizData = null;
+
+function renderContent(hash) {
+    if (!hash) {
+        return '';
+    }
+    return `<div class="content-blob" data-hash="${hash}">${CONTENT_CACHE[hash] || ''}</div>`
+}
+
+function loadContent() {
+    $('.content-blob').each(function (index, item) {
+        const hash = $(item).attr('data-hash');
+        if (hash in CONTENT_CACHE) {
+            return;
+        }
+        CONTENT_CACHE[hash] = '';
+        $.ajax({url: `/api/content/${hash}`, dataType: 'text'}).done(function(content) {
+            CONTENT_CACHE[hash] = content;
+            $(`.content-blob[data-hash=${hash}]`).html(content);
+        }).fail(function() {
+            delete CONTENT_CACHE[hash];
+        });
+    });
+}
 
 function renderQuestion(data) {
     var inputs = "";
     const sectionClosed = !!data.correct.length;
 
-    if (data.content) {
-        CONTENT_CACHE[data.id] = data.content
-    }
-    if (data.answer_content) {
-        ANSWER_CONTENT_CACHE[data.id] = data.answer_content
-    }
-
     if (data.values != null) {
         data.values.forEach(function (value) {
             const correct = data.correct.includes(value);
@@ -63,9 +80,9 @@ function renderQuestion(data) {
         <div class="question-content ${data.closed ? 'disabled' : 'enabled'}">
             ${data.text || ''}
             <br>
-            ${CONTENT_CACHE[data.id] || ''}
+            ${renderContent(data.content_hash)}
             <br>
-            ${sectionClosed ? ANSWER_CONTENT_CACHE[data.id] || '' : ''}
+            ${sectionClosed ? renderContent(data.answer_content_hash) : ''}
         </div>
         <div class="question-bar">
             <div class="btn-group" role="group">
@@ -76,7 +93,7 @@ function renderQuestion(data) {
                 <button type="button" class="btn btn-${data.closed ? 'danger' : 'default'}" onclick="closeQuestion(${data.id})">
                     <span class="glyphicon glyphicon-lock"></span>
                 </button>` : 
-                `<button type="button" class="btn btn-success ${sectionClosed || data.closed ? 'disabled' : ''}" ${sectionClosed || data.closed ? 'disabled' : ''} onclick="setAnswer(${data.id})">
+                `<button type="button" class="btn btn-success ${sectionClosed || data.closed ? 'disabled' : ''}" ${sectionClosed || data.closed ? 'disabled' : ''} onclick="setAnswer(${data.id}, ${data.section_id})">
                     <span class="glyphicon glyphicon-save"></span> ${data.answers ? answersStr : ''}  
                 </button>`}
                 ${data.average != null ? `
@@ -168,28 +185,120 @@ function renderQuiz(data) {
     `
 }
 
+function byOrder(a, b) {
+    return a.order_number - b.order_number;
+}
+
+function storeQuestion(question) {
+    quizData.sections.forEach(function (section) {
+        section.questions = section.questions.filter((item) => item.id !== question.id);
+        if (section.id === question.section_id) {
+            section.questions.push(question);
+            section.questions.sort(byOrder);
+        }
+    });
+}
+
+function applyDelta(data) {
+    if (data.full || !quizData || data.since !== quizData.version) {
+        quizData = data;
+        return;
+    }
+
+    quizData.sections = quizData.sections.filter((section) => !data.removed_sections.includes(section.id));
+    data.sections.forEach(function (section) {
+        const old = quizData.sections.find((item) => item.id === section.id);
+        section.questions = old ? old.questions : [];
+        quizData.sections = quizData.sections.filter((item) => item.id !== section.id);
+        quizData.sections.push(section);
+    });
+
+    quizData.sections.forEach(function (section) {
+        section.questions = section.questions.filter((question) => !data.removed_questions.includes(question.id));
+    });
+    data.questions.forEach(storeQuestion);
+
+    // Positions of items change when other items are inserted, moved or removed
+    quizData.sections.forEach(function (section) {
+        if (section.id in data.section_positions) {
+            section.order_number = data.section_positions[section.id];
+        }
+        section.questions.forEach(function (question) {
+            if (question.id in data.question_positions) {
+                question.order_number = data.question_positions[question.id];
+            }
+        });
+        section.questions.sort(byOrder);
+    });
+    quizData.sections.sort(byOrder);
+
+    const changed = data.rankings.map((row) => row.id);
+    quizData.rankings = quizData.rankings
+        .filter((row) => !data.removed_rankings.includes(row.id) && !changed.includes(row.id))
+        .concat(data.rankings);
+    quizData.rankings.sort((a, b) => a.rank - b.rank || a.id - b.id);
+
+    ['name', 'start_time', 'end_time', 'version', 'points', 'user_id'].forEach(function (key) {
+        quizData[key] = data[key];
+    });
+}
+
+function replaceQuestion(data) {
+    if (quizData) {
+        storeQuestion(data);
+    }
+    $(`#question-${data.id}`).replaceWith(renderQuestion(data));
+    $('form').on('submit', (evt) => evt.preventDefault());
+    loadContent();
+}
+
 function update(repeat = false) {
-    data = {'cached_content': Object.keys(CONTENT_CACHE).join(','), 'cached_answers': Object.keys(ANSWER_CONTENT_CACHE).join(',')}
+    data = {}
     if (!repeat) {
         data.force = true
+    } else if (quizData) {
+        data.since = quizData.version
     }
-    $.getJSON(`/api/quiz/${QUIZ_ID}/`, data, function(data) {
+    $.ajax({url: `/api/quiz/${QUIZ_ID}/`, data: data, dataType: 'json', ifModified: true}).done(function(data) {
         if (data) {
             if (!repeat || autoRefresh) {
-                $('#quiz').html(renderQuiz(data));
+                applyDelta(data);
+                $('#quiz').html(renderQuiz(quizData));
                 /*$(".question-text, .question-radio").on('change', function(){
                     setAnswer($(this).attr('data-id'));
                 });*/
                 $('form').on('submit', (evt) => evt.preventDefault());
+                loadContent();
             }
         }
     }).always(function() {
-        if (repeat && autoRefresh) {
+        if (repeat && autoRefresh && !eventSource) {
             setTimeout(function() {update(true)}, 2000);
         }
     });
 }
 
+function listen() {
+    if (!QUIZ_EVENTS || !window.EventSource) {
+        update(true);
+        return;
+    }
+
+    eventSource = new EventSource(`/api/quiz/${QUIZ_ID}/events`);
+    eventSource.addEventListener('update', function() {
+        if (autoRefresh) {
+            update(true);
+        }
+    });
+    eventSource.onerror = function() {
+        if (eventSource.readyState === EventSource.CLOSED) {
+            // Fall back to polling
+            eventSource = null;
+            update(true);
+        }
+    };
+}
+
 function setAutoRefresh(refreshing) {
     autoRefresh = refreshing;
     if (refreshing) {
@@ -200,10 +309,29 @@ function setAutoRefresh(refreshing) {
     }
 }
 
+function findQuestion(id) {
+    for (const section of quizData ? quizData.sections : []) {
+        const question = section.questions.find((item) => item.id === id);
+        if (question) {
+            return question;
+        }
+    }
+    return null;
+}
+
+function patchQuestion(id, changes) {
+    const question = findQuestion(id);
+    if (!question) {
+        refreshQuestion(id);
+        return;
+    }
+    Object.assign(question, changes);
+    replaceQuestion(question);
+}
+
 function like(id) {
-    $.post(`/api/questions/${id}/like`).done(function(data) {
-        $(`#question-${data.id}`).replaceWith(renderQuestion(data));
-        $('form').on('submit', (evt) => evt.preventDefault());
+    $.post(`/api/questions/${id}/like`, {compact: 1}).done(function(data) {
+        patchQuestion(data.id, {liked: data.liked, likes: data.likes});
     });
     $(`#question-${id} button`).attr('disabled', true);
 }
@@ -228,31 +356,35 @@ function closeSection(id) {
     $(`#section-${id} button`).attr('disabled', true);
 }
 
-function setAnswer(id) {
-    $.post(`/api/questions/${id}/clear`).always(function() {
-        $(`.question-text[data-id=${id}]`).each(function (index, item) {
-            $.post(`/api/questions/${id}/answer`, {value: $(item).val()}).done(function(data) {
-                $(`#question-${data.id}`).replaceWith(renderQuestion(data));
-                $('form').on('submit', (evt) => evt.preventDefault());
-            })
-        });
-        $(`.question-radio[data-id=${id}]:checked`).each(function (index, item) {
-            $.post(`/api/questions/${id}/answer`, {value: $(item).val()}).done(function(data) {
-                $(`#question-${data.id}`).replaceWith(renderQuestion(data));
-                $('form').on('submit', (evt) => evt.preventDefault());
-            })
-        });
-        update();
-    })
+function answered(data) {
+    const answers = {};
+    data.answers.forEach(function (value) {
+        answers[value] = false;
+    });
+    patchQuestion(data.id, {answers: answers});
+}
+
+function setAnswer(id, sectionId) {
+    const values = [];
+    $(`.question-text[data-id=${id}], .question-radio[data-id=${id}]:checked`).each(function (index, item) {
+        values.push($(item).val());
+    });
+    $.ajax({
+        url: `/api/sections/${sectionId}/answers`,
+        type: 'POST',
+        contentType: 'application/json',
+        data: JSON.stringify({answers: {[id]: values}})
+    }).done(function(data) {
+        for (const [questionId, answers] of Object.entries(data.answers)) {
+            answered({id: Number(questionId), answers: answers});
+        }
+    }).fail(function() {refreshQuestion(id)});
 }
 
 function refreshQuestion(id) {
-    $.get(`/api/questions/${id}`).done(function(data) {
-        $(`#question-${data.id}`).replaceWith(renderQuestion(data));
-        $('form').on('submit', (evt) => evt.preventDefault());
-    })
+    $.get(`/api/questions/${id}`).done(replaceQuestion)
 }
 
 
-update(true);
+listen();
 update();
\ No newline at end of file
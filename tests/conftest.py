@@ -0,0 +1,80 @@
+import datetime as dt
+import os
+import sys
+
+import pytest
+import sqlalchemy as sa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import model as md
+from app import app as quiz_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    quiz_app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite:///' + str(tmp_path / 'test.db'),
+        TESTING=True,
+        WTF_CSRF_ENABLED=False)
+    for cache in (md.statistics_cache, md.snapshot_cache, md.ranking_cache, md.matcher_cache):
+        cache.clear()
+    with quiz_app.test_request_context():
+        md.db.create_all()
+        yield quiz_app
+        md.db.session.remove()
+    md.db.get_engine(quiz_app).dispose()
+
+
+@pytest.fixture
+def queries(app):
+    """Statements executed on the engine of the app, collected while the test runs."""
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = md.db.get_engine()
+    sa.event.listen(engine, 'before_cursor_execute', collect)
+    yield statements
+    sa.event.remove(engine, 'before_cursor_execute', collect)
+
+
+def make_users(count: int, prefix: str = 'user') -> list:
+    users = [md.User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password='x', active=True)
+             for i in range(count)]
+    md.db.session.add_all(users)
+    md.db.session.flush()
+    return users
+
+
+def make_quiz(sections: int, questions: int, users: list) -> md.Quiz:
+    """Creates a quiz hosted by the first user, answered and liked by the others."""
+    quiz = md.Quiz(name='Quiz', start_time=dt.datetime(2020, 1, 1), last_updated=dt.datetime(2020, 1, 1))
+    quiz.hosts.append(users[0])
+    md.db.session.add(quiz)
+    for s in range(sections):
+        section = md.Section(name=f'Section {s}', order_number=s + 1, container=quiz, user_id=users[0].id,
+                             closed=s % 2 == 0)
+        md.db.session.add(section)
+        for q in range(questions):
+            question = md.Question(text=f'Question {s}.{q}', content=f'<p>{s}.{q}</p>', order_number=q + 1,
+                                   container=section, open=True, closed=section.closed, max_answers=1 + q % 2,
+                                   bonus=q == 3)
+            md.db.session.add(question)
+            md.db.session.add(md.Value(text='apple', points=1, order_number=1, question=question))
+            md.db.session.add(md.Value(text='banana', points=-1, order_number=2, question=question))
+            for user in users[1:]:
+                md.db.session.add(md.Answer(value='apple', user=user, question=question))
+            question.likes.append(users[-1])
+    md.db.session.commit()
+    return quiz
+
+
+def login(app, user: md.User):
+    """Returns a test client logged in as the user."""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
@@ -0,0 +1,29 @@
+import warnings
+
+import sqlalchemy as sa
+
+import model as md
+from conftest import login, make_quiz, make_users
+
+
+def test_deleting_answer_updates_scores(app):
+    users = make_users(3)
+    quiz = make_quiz(1, 2, users)
+    md.db.session.add(md.Role(name='admin'))
+    users[0].add_roles('admin')
+    section = quiz.sections[0]
+    section.calculate_points()
+    md.db.session.commit()
+    scores = {score.user_id: score.points for score in md.SectionScore.query.filter_by(section_id=section.id)}
+    assert scores == {users[1].id: 2, users[2].id: 2}
+    answer = md.Answer.query.filter_by(user_id=users[1].id).first()
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', sa.exc.SAWarning)
+        response = login(app, users[0]).post('/answer/delete/', data={'id': answer.id})
+
+    assert response.status_code == 302
+    md.db.session.expire_all()
+    assert md.Answer.query.get(answer.id) is None
+    scores = {score.user_id: score.points for score in md.SectionScore.query.filter_by(section_id=section.id)}
+    assert scores == {users[1].id: 1, users[2].id: 2}
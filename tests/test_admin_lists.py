@@ -0,0 +1,28 @@
+import flask
+import pytest
+
+import model as md
+from conftest import login, make_quiz, make_users
+
+
+def position_queries(queries) -> list:
+    return [statement for statement in queries
+            if statement.startswith('SELECT count(') and ('question.order_number <' in statement or
+                                                         'section.order_number <' in statement)]
+
+
+@pytest.mark.parametrize('endpoint', ['section', 'question', 'value', 'answer'])
+def test_list_positions_are_batched(app, queries, endpoint):
+    users = make_users(3)
+    make_quiz(3, 4, users)
+    md.db.session.add(md.Role(name='admin'))
+    users[0].add_roles('admin')
+    md.db.session.commit()
+    client = login(app, users[0])
+    url = flask.url_for(f'{endpoint}.index_view', page_size=100)
+
+    queries.clear()
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert position_queries(queries) == []
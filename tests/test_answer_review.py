@@ -0,0 +1,61 @@
+import model as md
+from conftest import login, make_users
+
+
+def test_override_survives_closing_section(app):
+    host, *players = make_users(4)
+    quiz = md.Quiz(name='Quiz')
+    quiz.hosts.append(host)
+    section = md.Section(name='Section', order_number=1, container=quiz, user_id=host.id)
+    question = md.Question(text='Country', order_number=1, container=section, open=True)
+    md.db.session.add_all([
+        quiz, section, question,
+        md.Value(text='Austria', points=1, allowed_misses=2, order_number=1, question=question),
+        md.Value(text='Australia', points=-1, allowed_misses=3, order_number=2, question=question)])
+    md.db.session.commit()
+    for (player, value) in zip(players, ['Austria', 'austria', 'AUSTRIA ']):
+        login(app, player).post(f'/api/questions/{question.id}/answer', data={'value': value})
+    assert {answer.value: answer.points for answer in question.answers} == {'Austria': -1, 'austria': 1, 'AUSTRIA ': 1}
+
+    assert question.override_points('austria', 0, add_value=True) == 3
+    md.db.session.commit()
+
+    assert login(app, host).post(f'/api/sections/{section.id}/close').status_code == 200
+    md.db.session.expire_all()
+    assert md.Section.query.get(section.id).closed
+    assert {answer.value: answer.points for answer in md.Question.query.get(question.id).answers} \
+        == {'Austria': 0, 'austria': 0, 'AUSTRIA ': 0}
+    assert md.SectionScore.query.filter_by(section_id=section.id).count() == 3
+    assert {score.points for score in md.SectionScore.query.filter_by(section_id=section.id)} == {0}
+
+
+def test_override_values_are_hidden_from_players(app):
+    host, player, other = make_users(3)
+    quiz = md.Quiz(name='Quiz')
+    quiz.hosts.append(host)
+    section = md.Section(name='Section', order_number=1, container=quiz, user_id=host.id)
+    question = md.Question(text='Fruit', order_number=1, container=section, open=True, show_values=True)
+    md.db.session.add_all([
+        quiz, section, question,
+        md.Value(text='apple', points=1, order_number=1, question=question),
+        md.Value(text='pear', points=-1, order_number=2, question=question)])
+    md.db.session.commit()
+    login(app, player).post(f'/api/questions/{question.id}/answer', data={'value': 'Peach'})
+    login(app, other).post(f'/api/questions/{question.id}/answer', data={'value': 'apple'})
+    assert question.override_points('peach', 2, add_value=True) == 1
+    assert question.override_points('apple', 0, add_value=True) == 1
+    md.db.session.commit()
+    assert question.values.filter(md.Value.override == True).count() == 2
+
+    (question_data,) = quiz.data(player)['sections'][0]['questions']
+    assert question_data['values'] == ['apple', 'pear']
+
+    assert login(app, host).post(f'/api/sections/{section.id}/close').status_code == 200
+    md.db.session.expire_all()
+    (question_data,) = md.Quiz.query.get(quiz.id).data(host)['sections'][0]['questions']
+    assert question_data['values'] == ['apple', 'pear']
+    assert question_data['correct'] == ['apple']
+
+    page = login(app, host).get(f'/quiz/{quiz.id}/static').get_data(as_text=True)
+    assert 'pear' in page
+    assert 'Peach' not in page and page.count('apple') == 2
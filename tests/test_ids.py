@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+import model as md
+from conftest import make_quiz, make_users
+
+
+def test_flush_checks_ids_once_per_table(app, queries):
+    users = make_users(2)
+    quiz = make_quiz(1, 1, users)
+    question = quiz.sections[0].questions[0]
+
+    queries.clear()
+    md.db.session.add_all([md.Value(text=f'value {i}', points=1, order_number=i, question=question)
+                           for i in range(50)])
+    md.db.session.flush()
+
+    assert len([statement for statement in queries if statement.startswith('SELECT value.id')]) == 1
+    ids = [value.id for value in question.values]
+    assert len(set(ids)) == len(ids)
+    assert len({value_id % 1000 for value_id in ids}) > 1
+
+
+def test_taken_ids_are_drawn_again(app, monkeypatch):
+    users = make_users(2)
+    taken = [user.id for user in users]
+    draws = iter(taken + [123456789])
+    monkeypatch.setattr(random, 'randint', lambda low, high: next(draws))
+
+    assert md.id_allocator.allocate(md.User) == 123456789
+
+
+def test_allocation_gives_up_when_ids_are_taken(app, monkeypatch):
+    (user,) = make_users(1)
+    taken = iter(range(user.id, user.id + 1000))
+    md.db.session.add_all([md.User(id=user_id, username=f'taken{user_id}', email=f'taken{user_id}@example.com',
+                                   password='x', active=True) for user_id in range(user.id + 1, user.id + 1000)])
+    md.db.session.flush()
+    monkeypatch.setattr(random, 'randint', lambda low, high: next(taken))
+
+    with pytest.raises(RuntimeError):
+        md.id_allocator.allocate(md.User)
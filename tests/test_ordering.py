@@ -0,0 +1,112 @@
+import pytest
+
+import model as md
+from conftest import make_users
+
+
+@pytest.fixture
+def section(app):
+    user, = make_users(1)
+    quiz = md.Quiz(name='Quiz')
+    section = md.Section(name='Section', order_number=1, container=quiz, user_id=user.id)
+    md.db.session.add_all([quiz, section])
+    for text in 'abcd':
+        question = md.Question(text=text, container=section)
+        md.db.session.add(question)
+        question.set_order()
+        md.db.session.flush()
+    md.db.session.commit()
+    return section
+
+
+def texts(section: md.Section) -> str:
+    return ''.join(question.text for question in section.questions.order_by(md.Question.order_number, md.Question.id))
+
+
+def keys(section: md.Section) -> dict:
+    return {question.text: question.order_number for question in section.questions}
+
+
+def question(section: md.Section, text: str) -> md.Question:
+    return section.questions.filter_by(text=text).one()
+
+
+def test_insert_between_neighbours(section):
+    before = keys(section)
+    new = md.Question(text='x', container=section)
+    md.db.session.add(new)
+    new.set_order(2)
+    md.db.session.commit()
+
+    assert texts(section) == 'axbcd'
+    assert before['a'] < new.order_number < before['b']
+    assert {text: key for (text, key) in keys(section).items() if text != 'x'} == before
+
+
+def test_move_up(section):
+    before = keys(section)
+    question(section, 'd').set_order(2)
+    md.db.session.commit()
+
+    assert texts(section) == 'adbc'
+    assert before['a'] < keys(section)['d'] < before['b']
+    del before['d']
+    assert {text: key for (text, key) in keys(section).items() if text != 'd'} == before
+
+
+def test_move_down(section):
+    question(section, 'a').set_order(3)
+    md.db.session.commit()
+    assert texts(section) == 'bcad'
+
+    question(section, 'b').set_order(4)
+    md.db.session.commit()
+    assert texts(section) == 'cadb'
+
+
+def test_gap_exhaustion_renumbers(section):
+    expected = list('abcd')
+    for i in range(15):
+        new = md.Question(text=f'x{i}', container=section)
+        md.db.session.add(new)
+        new.set_order(2)
+        md.db.session.commit()
+        expected.insert(1, f'x{i}')
+
+    ordered = section.questions.order_by(md.Question.order_number, md.Question.id).all()
+    assert [item.text for item in ordered] == expected
+    assert len({item.order_number for item in ordered}) == len(ordered)
+    assert [item.position for item in ordered] == list(range(1, len(ordered) + 1))
+
+
+def test_dense_moves_shift_neighbours(section, monkeypatch):
+    monkeypatch.setattr(md.Question, 'order_gap', 1)
+    md.Question.reorder(section, [item.id for item in section.questions])
+    md.db.session.commit()
+    assert keys(section) == {'a': 1, 'b': 2, 'c': 3, 'd': 4}
+
+    question(section, 'd').set_order(2)
+    md.db.session.commit()
+    assert keys(section) == {'a': 1, 'd': 2, 'b': 3, 'c': 4}
+
+    question(section, 'a').set_order(3)
+    md.db.session.commit()
+    assert keys(section) == {'d': 1, 'b': 2, 'a': 3, 'c': 4}
+
+    new = md.Question(text='x', container=section)
+    md.db.session.add(new)
+    new.set_order(1)
+    md.db.session.commit()
+    assert keys(section) == {'x': 1, 'd': 2, 'b': 3, 'a': 4, 'c': 5}
+
+
+def test_reorder(section):
+    ids = {item.text: item.id for item in section.questions}
+    assert md.Question.reorder(section, [ids[text] for text in 'dbac']) == 3
+    md.db.session.commit()
+    assert texts(section) == 'dbac'
+    assert sorted(keys(section).values()) == [1024, 2048, 3072, 4096]
+
+    assert md.Question.reorder(section, [ids[text] for text in 'dbac']) == 0
+    with pytest.raises(ValueError):
+        md.Question.reorder(section, [ids[text] for text in 'dba'])
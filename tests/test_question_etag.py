@@ -0,0 +1,26 @@
+import model as md
+from conftest import login, make_quiz, make_users
+
+
+def test_answering_other_bonus_question_changes_etag(app):
+    users = make_users(2)
+    quiz = make_quiz(2, 1, users)
+    section = quiz.sections.filter_by(closed=False).one()
+    first, second = (md.Question(text=f'Bonus {i}', order_number=10 + i, container=section, open=True, bonus=True)
+                     for i in range(2))
+    md.db.session.add_all([first, second])
+    player = md.User(username='player', email='player@example.com', password='x', active=True)
+    md.db.session.add(player)
+    md.db.session.commit()
+    client = login(app, player)
+
+    response = client.get(f'/api/questions/{first.id}')
+    etag = response.headers['ETag']
+    assert not response.get_json()['closed']
+    assert client.get(f'/api/questions/{first.id}', headers={'If-None-Match': etag}).status_code == 304
+
+    client.post(f'/api/questions/{second.id}/answer', data={'value': 'apple'})
+
+    response = client.get(f'/api/questions/{first.id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['closed']
@@ -0,0 +1,27 @@
+import pytest
+
+import model as md
+from conftest import make_quiz, make_users
+
+
+def count_data_queries(queries, sections: int, questions: int) -> tuple:
+    users = make_users(4, f'user{sections}x{questions}-')
+    quiz = make_quiz(sections, questions, users)
+    user_id, quiz_id = users[1].id, quiz.id
+    md.db.session.expire_all()
+    user = md.User.query.get(user_id)
+    quiz = md.Quiz.query.get(quiz_id)
+
+    counts = []
+    for _ in range(2):
+        queries.clear()
+        data = quiz.data(user)
+        counts.append(len(queries))
+    assert len(data['sections']) == sections
+    assert sum(len(section['questions']) for section in data['sections']) == sections * questions
+    return tuple(counts)
+
+
+@pytest.mark.parametrize('sections,questions', [(2, 3), (6, 10)])
+def test_data_queries_do_not_grow_with_quiz(app, queries, sections, questions):
+    assert count_data_queries(queries, sections, questions) == count_data_queries(queries, 1, 1)
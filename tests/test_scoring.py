@@ -0,0 +1,61 @@
+import random
+
+from Levenshtein import distance as str_distance
+
+import model as md
+from conftest import make_quiz, make_users
+
+WORDS = ['apple', 'the banana', 'cherry pie', 'a dog', 'az alma', 'x-ray', 'zebra', 'pizza place', 'Apple ', 'aple',
+         'banan', 'dog', 'xray', 'alma', 'zzz', 'a', '']
+
+
+def normalize(text: str) -> str:
+    return text.strip().lower().replace('the ', '').replace('a ', '').replace('az ', '').replace(' ', '')\
+        .replace('-', '')
+
+
+def reference_points(answer: md.Answer) -> float:
+    """Scores the answer like `Answer._calculate_points` did before answers were scored in bulk."""
+    for value in answer.question.values.filter(md.Value.points <= 0):
+        if value.allowed_misses:
+            if str_distance(value.text, answer.value) < value.allowed_misses:
+                return value.points or 0
+        elif value.text == answer.value:
+            return value.points
+
+    for value in answer.question.values.filter(md.Value.points > 0):
+        if value.allowed_misses:
+            if str_distance(normalize(value.text), normalize(answer.value)) < value.allowed_misses:
+                return value.points or 0
+        elif normalize(value.text) == normalize(answer.value):
+            return value.points
+
+    return answer.question.base_points
+
+
+def test_bulk_scoring_matches_per_answer_loop(app):
+    rnd = random.Random(7)
+    users = make_users(6)
+    make_quiz(4, 6, users)
+    for question in md.Question.query:
+        for value in question.values:
+            md.db.session.delete(value)
+        for i in range(rnd.randint(0, 7)):
+            md.db.session.add(md.Value(text=rnd.choice(WORDS[:-1]), question=question, order_number=i + 1,
+                                       allowed_misses=rnd.choice([0, 0, 1, 2, 3, 5]),
+                                       points=rnd.choice([2, 1, 0.5, 0, -1, None])))
+        question.base_points = rnd.choice([0, -1, 1])
+    for answer in md.Answer.query:
+        answer.value = rnd.choice(WORDS)
+    md.db.session.commit()
+
+    answers = md.Answer.query.all()
+    expected = {answer.id: reference_points(answer) for answer in answers}
+
+    matchers = md.AnswerMatcher.for_questions()
+    assert {answer.id: matchers[answer.question_id].points(answer.value) for answer in answers} == expected
+
+    for section in md.Section.query:
+        section.calculate_points()
+    md.db.session.commit()
+    assert dict(md.db.session.query(md.Answer.id, md.Answer.points)) == expected
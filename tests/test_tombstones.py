@@ -0,0 +1,27 @@
+import model as md
+from conftest import make_quiz, make_users
+
+
+def test_moving_through_relationship_leaves_tombstones(app):
+    users = make_users(3)
+    quiz = make_quiz(2, 2, users)
+    other = md.Quiz(name='Other')
+    other_section = md.Section(name='Other section', order_number=1, container=other, user_id=users[0].id)
+    md.db.session.add_all([other, other_section])
+    md.db.session.commit()
+    (section, kept) = quiz.sections.order_by(md.Section.order_number).all()
+    question = kept.questions[0]
+    (section_id, question_id, quiz_id) = (section.id, question.id, quiz.id)
+    since = quiz.data(users[1])['version']
+
+    section.container = other
+    question.container = other_section
+    md.db.session.commit()
+
+    assert {(tombstone.kind, tombstone.entity_id) for tombstone in md.Tombstone.query.filter_by(quiz_id=quiz_id)} \
+        == {('section', section_id), ('question', question_id)}
+    md.db.session.expire_all()
+    data = md.Quiz.query.get(quiz_id).data(md.User.query.get(users[1].id), since=since)
+    assert not data['full']
+    assert data['removed_sections'] == [section_id]
+    assert data['removed_questions'] == [question_id]
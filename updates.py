@@ -0,0 +1,165 @@
+import abc
+import datetime as dt
+import os
+import sqlite3
+import threading
+import time as tm
+import typing
+
+from flask import current_app
+
+
+class UpdateStore(abc.ABC):
+    """Remembers when users last received the data of a quiz.
+
+    Entries expire `ttl` seconds after they were last set. The hit and miss counters are kept by each process, even
+    if the backend shares the entries between processes, so `stats` reports the lookups of the current process.
+
+    :param ttl: Lifetime of entries in seconds.
+    """
+    sweep_interval = 60
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._last_sweep = tm.time()
+
+    def get(self, user_id: int, quiz_id: int) -> typing.Optional[dt.datetime]:
+        value = self._get(f'{user_id}:{quiz_id}', tm.time())
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, user_id: int, quiz_id: int, value: dt.datetime):
+        now = tm.time()
+        self._set(f'{user_id}:{quiz_id}', value, now + self.ttl)
+        if now - self._last_sweep > self.sweep_interval:
+            self._last_sweep = now
+            self._sweep(now)
+
+    def stats(self) -> dict:
+        return {
+            'backend': type(self).__name__,
+            'entries': len(self),
+            'pid': os.getpid(),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    @abc.abstractmethod
+    def _get(self, key: str, now: float) -> typing.Optional[dt.datetime]:
+        pass
+
+    @abc.abstractmethod
+    def _set(self, key: str, value: dt.datetime, expires: float):
+        pass
+
+    @abc.abstractmethod
+    def _sweep(self, now: float):
+        """Removes expired entries."""
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass
+
+
+class MemoryUpdateStore(UpdateStore):
+    """Update store of a single process."""
+    def __init__(self, ttl: float = 3600):
+        super().__init__(ttl)
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key: str, now: float) -> typing.Optional[dt.datetime]:
+        value, expires = self._data.get(key, (None, 0))
+        return value if expires > now else None
+
+    def _set(self, key: str, value: dt.datetime, expires: float):
+        with self._lock:
+            self._data[key] = (value, expires)
+
+    def _sweep(self, now: float):
+        with self._lock:
+            for key in [k for (k, (v, expires)) in self._data.items() if expires <= now]:
+                del self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteUpdateStore(UpdateStore):
+    """Update store in an SQLite file, shared by the worker processes of a host.
+
+    :param path: Path of the database file.
+    :param ttl: Lifetime of entries in seconds.
+    """
+    def __init__(self, path: str, ttl: float = 3600):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS api_update '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)')
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = conn
+        return conn
+
+    def _get(self, key: str, now: float) -> typing.Optional[dt.datetime]:
+        row = self._connection.execute(
+            'SELECT value FROM api_update WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        return dt.datetime.fromisoformat(row[0]) if row else None
+
+    def _set(self, key: str, value: dt.datetime, expires: float):
+        self._connection.execute(
+            'INSERT OR REPLACE INTO api_update (key, value, expires) VALUES (?, ?, ?)',
+            (key, value.isoformat(), expires))
+
+    def _sweep(self, now: float):
+        self._connection.execute('DELETE FROM api_update WHERE expires <= ?', (now, ))
+
+    def __len__(self) -> int:
+        return self._connection.execute('SELECT COUNT(*) FROM api_update').fetchone()[0]
+
+
+class UpdateTracker:
+    """Flask extension creating the update store selected by the `UPDATE_STORE` setting.
+
+    Supported backends are `memory` and `sqlite` (stored in `UPDATE_STORE_PATH`).
+    """
+    backends = {
+        'memory': lambda app, ttl: MemoryUpdateStore(ttl),
+        'sqlite': lambda app, ttl: SQLiteUpdateStore(app.config.get('UPDATE_STORE_PATH', 'data/updates.db'), ttl)
+    }
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('UPDATE_STORE', 'memory')
+        if backend not in self.backends:
+            raise ValueError(f'Undefined update store: {backend}')
+
+        ttl = app.config.get('UPDATE_STORE_TTL', 3600)
+        app.extensions['update_tracker'] = self.backends[backend](app, ttl)
+
+    @property
+    def store(self) -> UpdateStore:
+        return current_app.extensions['update_tracker']
+
+
+update_tracker = UpdateTracker()